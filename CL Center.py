@@ -1,29 +1,311 @@
 import sys
-import psutil
-import os
-import pyttsx3
+import time
+STARTUP_T0 = time.perf_counter()
+import argparse
+import signal
+import socket
+
+if __name__ == '__main__' and '--headless' in sys.argv:
+    # Never load Qt for the headless monitor
+    import cl_headless
+    sys.exit(cl_headless.main([arg for arg in sys.argv[1:] if arg != '--headless']))
+
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton,
-    QMessageBox, QDesktopWidget, QGridLayout
+    QMessageBox, QDesktopWidget, QGridLayout, QStackedWidget, QLayout, QFileDialog
+)
+from PyQt5.QtCore import QTimer, Qt, QObject, QPointF, QSocketNotifier, pyqtSignal
+from PyQt5.QtGui import QColor, QLinearGradient, QPalette, QBrush, QIcon, QFont, QPainter, QPen, QPolygonF
+
+from cl_actions import ACTION_DELAY, ACTIONS, ActionExecutor
+from cl_diag import shared_diagnostics
+from cl_metrics import (
+    EXTRA_METRICS, MetricRules, MetricSampler, SystemMetrics, extras_text, metric_alert_text, parse_limit
+)
+from cl_sources import live_source
+from cl_procs import ProcessTop, top_text
+from cl_core import (
+    SAMPLE_INTERVAL, MIN_INTERVAL, MAX_INTERVAL, CPU_LEVELS, AdaptiveInterval, RingBuffer,
+    CpuRules, CpuSampler, CoreThresholds, NetAccounting, NetRates, QuotaForecast, cpu_alert_text,
+    format_rate, have_numpy, net_headroom, net_state_path, shared_speech_alerts
 )
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QColor, QLinearGradient, QPalette, QBrush, QIcon, QFont
+
+
+class StartupTimer:
+    # Enabled with --startup-timing; reports each milestone once on stderr
+    def __init__(self, t0):
+        self.t0 = t0
+        self.enabled = False
+        self.marks = {}
+
+    def mark(self, name):
+        if self.enabled and name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.t0
+            print(f"startup: {name} {self.marks[name] * 1000:.1f} ms", file=sys.stderr)
+
+
+startup = StartupTimer(STARTUP_T0)
+
+
+class Sparkline(QWidget):
+    def __init__(self, history, color="#88C0D0", max_value=None, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.color = QColor(color)
+        self.max_value = max_value
+        self.setMinimumHeight(40)
+
+    def paintEvent(self, event):
+        if len(self.history) < 2:
+            return
+        values = list(self.history.values())
+        top = self.max_value or max(values) or 1.0
+        w, h = self.width() - 1, self.height() - 1
+        step = w / (self.history.capacity - 1)
+        x0 = w - step * (len(values) - 1)
+        line = QPolygonF([
+            QPointF(x0 + i * step, h - h * min(v, top) / top) for i, v in enumerate(values)
+        ])
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(self.color, 1.5))
+        painter.drawPolyline(line)
+        painter.end()
+
+
+class LoopLagProbe(QObject):
+    # A precise timer that notes how late it fires; anything blocking the
+    # event loop (a slow tick, a modal dialog's caller) shows up as lag.
+    # It only runs while someone is looking: the Diagnostics page or the
+    # metrics endpoint.
+    def __init__(self, period_ms=100, parent=None):
+        super().__init__(parent)
+        self.period = period_ms / 1000
+        self.lag = shared_diagnostics().histogram('event_loop_lag')
+        self.due = None
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(period_ms)
+        self.timer.timeout.connect(self.probe)
+
+    def start(self):
+        if not self.timer.isActive():
+            self.due = time.perf_counter() + self.period
+            self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def probe(self):
+        now = time.perf_counter()
+        self.lag.observe(max(0.0, now - self.due))
+        self.due = now + self.period
+
+
+class SignalWakeup(QObject):
+    # Python handles a signal only when the interpreter next runs, and an
+    # idle Qt event loop may not call back into Python for a long time. The
+    # C-level handler writes a byte to this socket, and the notifier wakes
+    # the loop so the Python handler runs straight away.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.writer.setblocking(False)
+        signal.set_wakeup_fd(self.writer.fileno())
+        self.notifier = QSocketNotifier(self.reader.fileno(), QSocketNotifier.Read, self)
+        self.notifier.activated.connect(self.drain)
+
+    def drain(self):
+        try:
+            while self.reader.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+
+
+class SamplerSignals(QObject):
+    sample = pyqtSignal(float)
+    cores = pyqtSignal(object)
+    extras = pyqtSignal(object)
+
+
+class ActionSignals(QObject):
+    done = pyqtSignal(bool, str)
+
+
+class PageView(QObject):
+    # Texts shown on a page. A widget is only marked dirty when its text
+    # actually changes, and dirty widgets are updated together at most once
+    # per frame, however many samples arrive in between.
+    FRAME_MS = 16
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.shown = {}  # (widget, setter) -> text on screen
+        self.pending = {}  # (widget, setter) -> text for the next frame
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.FRAME_MS)
+        self.timer.timeout.connect(self.flush)
+
+    def set_text(self, widget, text):
+        self.set(widget, 'setText', text)
+
+    def set_tooltip(self, widget, text):
+        self.set(widget, 'setToolTip', text)
+
+    def set(self, widget, setter, text):
+        key = (widget, setter)
+        if self.pending.get(key, self.shown.get(key)) == text:
+            return
+        self.pending[key] = text
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        for key, text in pending.items():
+            if self.shown.get(key) != text:
+                widget, setter = key
+                getattr(widget, setter)(text)
+                self.shown[key] = text
+
+
+class ControlCenter(QStackedWidget):
+    # The one top-level window. Pages are built on first use and then kept,
+    # so monitors carry on in the background while another page is shown.
+    def __init__(self, metrics=None, history=None, adaptive=None, source=None, sampler_process=False,
+                 actions=None, extras=None, sample_interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.source = source  # None means live psutil readings
+        self.sample_interval = sample_interval  # seconds between CPU and network samples
+        self.metrics = metrics
+        self.history = history
+        self.adaptive = adaptive  # (min_interval, max_interval) or None
+        self.sampler_process = sampler_process  # sample the CPU in a child process
+        self.actions = actions or ActionExecutor()  # what the armed end error does
+        self.extras = None  # a MetricSampler over the SystemMetrics given, running whichever page is shown
+        self.extra_rules = None
+        diagnostics = shared_diagnostics()
+        self.time_extras = diagnostics.timer('extra_tick')
+        self.time_alert = diagnostics.timer('alert')
+        if extras is not None:
+            self.extra_rules = MetricRules(extras.limits)
+            self.extra_signals = SamplerSignals(self)
+            self.extra_signals.extras.connect(self.show_extras)
+            self.extras = MetricSampler(extras, self.extra_signals.extras.emit)
+        self.setWindowFlags(Qt.Window | Qt.WindowTitleHint | Qt.CustomizeWindowHint)
+        self.setWindowIcon(QIcon("ICON.jpg"))
+        self.layout().setSizeConstraint(QLayout.SetNoConstraint)
+        self.pages = {}
+        self.page_sizes = {}
+        self.lag_probe = LoopLagProbe(parent=self)
+        if metrics is not None:
+            self.lag_probe.start()  # scraped at any time, so always measured
+        self.open_main()
+        self.center()
+        if self.extras is not None:
+            self.extras.start()
+
+    def center(self):
+        qr = self.frameGeometry()
+        cp = QDesktopWidget().availableGeometry().center()
+        qr.moveCenter(cp)
+        self.move(qr.topLeft())
+
+    def page(self, page_class, *args):
+        page = self.pages.get(page_class)
+        if page is None:
+            page = page_class(self, *args)
+            page.setAutoFillBackground(True)
+            page.setAttribute(Qt.WA_StyledBackground, True)
+            self.page_sizes[page] = page.size()
+            self.addWidget(page)
+            self.pages[page_class] = page
+        return page
+
+    def switch_to(self, page):
+        current = self.currentWidget()
+        if current is not None and current is not page:
+            self.page_sizes[current] = self.size()
+        self.setCurrentWidget(page)
+        self.setWindowTitle(page.windowTitle())
+        self.setMinimumSize(page.minimumSize())
+        self.setMaximumSize(page.maximumSize())
+        self.resize(self.page_sizes[page])
+
+    def open_main(self):
+        self.switch_to(self.page(MainWindow))
+
+    def open_internet_usage(self):
+        self.switch_to(self.page(InternetUsageMonitor, self.sample_interval))
+
+    def open_cpu_usage(self):
+        self.switch_to(self.page(CpuUsageWarner, self.sample_interval))
+
+    def open_diagnostics(self):
+        self.switch_to(self.page(DiagnosticsPage))
+
+    def adaptive_interval(self, base):
+        if self.adaptive is None:
+            return None
+        return AdaptiveInterval(base, *self.adaptive)
+
+    def publish_wakeups_saved(self):
+        if self.metrics is not None and self.adaptive is not None:
+            self.metrics.update(wakeups_saved={
+                name: int(page.adaptive.wakeups_saved) for name, page in (
+                    ('cpu', self.pages.get(CpuUsageWarner)), ('net', self.pages.get(InternetUsageMonitor)))
+                if page is not None and page.adaptive is not None
+            })
+
+    def show_extras(self, readings):
+        # Memory, swap, disk, load and temperature from the collection pass:
+        # recorded and checked here, shown on the CPU page once it is open
+        with self.time_extras:
+            cpu_page = self.pages.get(CpuUsageWarner)
+            if cpu_page is not None:
+                cpu_page.show_extras(readings)
+            raised = self.extra_rules.evaluate(readings)
+            if self.metrics is not None:
+                self.metrics.update(extras=readings)
+            if self.history is not None:
+                for name, value in readings.items():
+                    if name != 'disks':
+                        self.history.record(name, value)
+            for name, level in raised:
+                text = metric_alert_text(name, level, readings[name])
+                severity = CPU_LEVELS[level][1]
+                if self.metrics is not None:
+                    self.metrics.count_alert(name, severity)
+                if self.history is not None:
+                    self.history.record_event(name, severity, text)
+                if cpu_page is None or not cpu_page.state.muted:
+                    with self.time_alert:
+                        shared_speech_alerts().post(name, severity, text)
+
+    def closeEvent(self, event):
+        if self.extras is not None:
+            self.extras.close()
+        for page in self.pages.values():
+            page.close()
+        if self.history is not None:
+            self.history.close()
+        super().closeEvent(event)
 
 
 class MainWindow(QWidget):
-    def __init__(self):
+    def __init__(self, controller):
         super().__init__()
+        self.controller = controller
         self.initUI()
 
     def initUI(self):
         self.setWindowTitle("Main Control Page")
-        self.setFixedSize(400, 400)
-        self.setWindowFlags(Qt.Window | Qt.WindowTitleHint | Qt.CustomizeWindowHint)
-        self.setWindowIcon(QIcon("ICON.jpg"))
+        self.setFixedSize(400, 460)
         self.set_gradient_background()
 
-        self.center()
-
         layout = QVBoxLayout()
         layout.setSpacing(15)
         layout.setContentsMargins(30, 20, 30, 20)
@@ -84,6 +366,28 @@ class MainWindow(QWidget):
         self.cpu_button.clicked.connect(self.open_cpu_usage)
         layout.addWidget(self.cpu_button)
 
+        self.diagnostics_button = QPushButton("Diagnostics", self)
+        self.diagnostics_button.setStyleSheet("""
+            QPushButton {
+                background-color: #CCCCCC;
+                color: #333;
+                font-size: 16px;
+                font-weight: bold;
+                font-family: 'Segoe UI';
+                padding: 12px;
+                border: none;
+                border-radius: 8px;
+            }
+            QPushButton:hover {
+                background-color: #AAAAAA;
+            }
+            QPushButton:pressed {
+                background-color: #888888;
+            }
+        """)
+        self.diagnostics_button.clicked.connect(self.controller.open_diagnostics)
+        layout.addWidget(self.diagnostics_button)
+
         self.exit_button = QPushButton("Exit", self)
         self.exit_button.setStyleSheet("""
             QPushButton {
@@ -103,7 +407,7 @@ class MainWindow(QWidget):
                 background-color: #888888;
             }
         """)
-        self.exit_button.clicked.connect(self.close)
+        self.exit_button.clicked.connect(self.controller.close)
         layout.addWidget(self.exit_button)
 
         self.credit_label = QLabel("Written by: Arad Shoari, Armin Fazelzad, Radin Sadrkabir", self)
@@ -129,40 +433,38 @@ class MainWindow(QWidget):
         palette.setBrush(QPalette.Window, QBrush(gradient))
         self.setPalette(palette)
 
-    def center(self):
-        qr = self.frameGeometry()
-        cp = QDesktopWidget().availableGeometry().center()
-        qr.moveCenter(cp)
-        self.move(qr.topLeft())
-
     def open_internet_usage(self):
-        self.internet_usage_window = InternetUsageMonitor()
-        self.internet_usage_window.show()
-        self.close()
+        self.controller.open_internet_usage()
 
     def open_cpu_usage(self):
-        self.cpu_usage_window = CpuUsageWarner()
-        self.cpu_usage_window.show()
-        self.close()
+        self.controller.open_cpu_usage()
 
 
 class InternetUsageMonitor(QWidget):
-    def __init__(self):
+    def __init__(self, controller, sample_interval=SAMPLE_INTERVAL):
         super().__init__()
+        self.controller = controller
+        self.sample_interval = sample_interval
         self.usage_limit = None
-        self.warned = False
-        self.start_bytes = None
+        self.forecast = QuotaForecast()
+        self.notice = ''  # the latest warning stage, kept on the page until the limit changes
+        self.rates = NetRates()
+        self.source = controller.source or live_source()
+        self.net = NetAccounting(path=net_state_path(self.source))
+        self.adaptive = controller.adaptive_interval(sample_interval)
+        self.rate_history = RingBuffer()
+        self.view = PageView(self)
+        diagnostics = shared_diagnostics()
+        self.time_tick = diagnostics.timer('net_tick')
+        self.time_read = diagnostics.timer('net_read')
         self.initUI()
+        self.start_accounting()
 
     def initUI(self):
         self.setWindowTitle("Internet Usage Monitor")
-        self.setFixedSize(400, 300)
-        self.setWindowFlags(Qt.Window | Qt.WindowTitleHint | Qt.CustomizeWindowHint)
-        self.setWindowIcon(QIcon("ICON.jpg"))
+        self.setFixedSize(400, 470)
         self.set_gradient_background()
 
-        self.center()
-
         layout = QVBoxLayout()
         layout.setSpacing(10)
         layout.setContentsMargins(20, 15, 20, 15)
@@ -234,6 +536,31 @@ class InternetUsageMonitor(QWidget):
         """)
         layout.addWidget(self.usage_label)
 
+        self.rate_label = QLabel("", self)
+        self.rate_label.setStyleSheet("""
+            QLabel {
+                font-size: 13px;
+                color: #333;
+                font-family: 'Segoe UI';
+            }
+        """)
+        layout.addWidget(self.rate_label)
+
+        self.forecast_label = QLabel("", self)
+        self.forecast_label.setWordWrap(True)
+        self.forecast_label.setStyleSheet("""
+            QLabel {
+                font-size: 13px;
+                font-weight: bold;
+                color: #00796B;
+                font-family: 'Segoe UI';
+            }
+        """)
+        layout.addWidget(self.forecast_label)
+
+        self.rate_chart = Sparkline(self.rate_history, "#00838F", parent=self)
+        layout.addWidget(self.rate_chart)
+
         self.back_button = QPushButton("Back to Main Control Page", self)
         self.back_button.setStyleSheet("""
             QPushButton {
@@ -260,7 +587,7 @@ class InternetUsageMonitor(QWidget):
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_usage)
-        self.timer.start(1000)
+        self.timer.start(int(self.sample_interval * 1000))
 
     def set_gradient_background(self):
         gradient = QLinearGradient(0, 0, 0, self.height())
@@ -270,64 +597,181 @@ class InternetUsageMonitor(QWidget):
         palette.setBrush(QPalette.Window, QBrush(gradient))
         self.setPalette(palette)
 
-    def center(self):
-        qr = self.frameGeometry()
-        cp = QDesktopWidget().availableGeometry().center()
-        qr.moveCenter(cp)
-        self.move(qr.topLeft())
+    def start_accounting(self):
+        self.net.load(self.source.boot_time())
+        self.net.update(self.source.net_io_counters())
+        self.last_update = self.source.time()
+        self.rates.begin(self.last_update)
+        if self.net.limit_mb is not None:
+            self.usage_limit = self.net.limit_mb
+            self.label.setText(f"Limit set to {self.usage_limit} MB")
+            self.view.set_text(self.usage_label, f"Current Usage: {self.net.usage_mb():.2f} MB")
 
     def set_limit(self):
         try:
             self.usage_limit = float(self.limit_input.text())
             self.label.setText(f"Limit set to {self.usage_limit} MB")
-            self.start_bytes = psutil.net_io_counters().bytes_sent + psutil.net_io_counters().bytes_recv
-            self.warned = False
+            self.net.set_limit(self.usage_limit)
+            self.rate_history.clear()
+            self.rate_chart.update()
+            self.forecast.reset()
+            self.notice = ''
         except ValueError:
             QMessageBox.warning(self, "Invalid Input", "Please enter a valid number.")
 
     def update_usage(self):
-        if self.usage_limit is None or self.start_bytes is None:
+        with self.time_tick:
+            self.count_usage()
+
+    def count_usage(self):
+        with self.time_read:
+            moved = self.net.update(self.source.net_io_counters())
+        now = self.source.time()
+        rate = moved / max(now - self.last_update, 1e-3)  # bytes per second
+        self.last_update = now
+        self.rates.add(now, *self.net.moved)
+        rates = self.rates.rates(now)
+        self.view.set_text(self.rate_label, '\n'.join(
+            f"{window}: \u2191 {format_rate(up)}   \u2193 {format_rate(down)}" for window, (up, down) in rates.items()))
+        if self.adaptive is not None:
+            usage = self.net.usage_mb() if self.usage_limit is not None else None
+            headroom = net_headroom(usage, self.usage_limit, rate / 1048576) if usage is not None else None
+            self.timer.setInterval(int(self.adaptive.update(headroom) * 1000))
+            self.controller.publish_wakeups_saved()
+        if self.controller.history is not None:
+            self.controller.history.record('net_bytes', moved)
+        if self.usage_limit is None:
             return
 
-        net_io = psutil.net_io_counters()
-        current_bytes = net_io.bytes_sent + net_io.bytes_recv
-        total_bytes_used = current_bytes - self.start_bytes
-        total_mb_used = total_bytes_used / (1024 * 1024)
-        self.usage_label.setText(f"Current Usage: {total_mb_used:.2f} MB")
-
-        if total_mb_used > self.usage_limit and not self.warned:
-            self.warned = True
-            QMessageBox.warning(
-                self, "Usage Limit Exceeded",
-                f"Internet usage has exceeded the limit of {self.usage_limit} MB!"
-            )
+        total_mb_used = self.net.usage_mb()
+        self.view.set_text(self.usage_label, f"Current Usage: {total_mb_used:.2f} MB")
+        startup.mark("first_sample")
+        self.show_forecast(total_mb_used, rates)
+        if self.controller.metrics is not None:
+            self.controller.metrics.update(
+                net_totals=self.net.nic_totals(), net_mb=total_mb_used, limit_mb=self.usage_limit,
+                net_rates=rates, limit_eta=self.forecast.eta)
+        if self.controller.history is not None:
+            self.controller.history.record('net_mb', total_mb_used)
+        self.rate_history.append(rate / 1024)  # KB/s
+        self.rate_chart.update()
+
+    def show_forecast(self, usage_mb, rates):
+        # Time to the limit at the 1 minute rate; each warning stage is
+        # spoken, logged and kept on the page, and exceeding the limit pops up
+        for stage, level, text in self.forecast.update(usage_mb, self.usage_limit, rates):
+            severity = CPU_LEVELS[level][1]
+            if self.controller.metrics is not None:
+                self.controller.metrics.count_alert('net', severity)
+            if self.controller.history is not None:
+                self.controller.history.record_event('net', severity, text)
+            if not stage:
+                QMessageBox.warning(self, "Usage Limit Exceeded", text)
+            else:
+                self.notice = text
+                shared_speech_alerts().post('net', severity, text)
+        text = self.forecast.text()
+        if self.notice:
+            text = f"\u26a0 {self.notice}\n{text}"
+        self.view.set_text(self.forecast_label, text)
 
     def back_to_main(self):
-        self.main_window = MainWindow()
-        self.main_window.show()
-        self.close()
+        self.controller.open_main()
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.net.save()
+        super().closeEvent(event)
+
+
+CPU_PAGE_STYLE = """
+    * {
+        background-color: #2E3440;
+        color: #D8DEE9;
+    }
+    QPushButton {
+        background-color: #4C566A;
+        color: #ECEFF4;
+        border: 2px solid #81A1C1;
+        border-radius: 5px;
+        padding: 5px;
+    }
+    QPushButton:hover {
+        background-color: #81A1C1;
+        color: #2E3440;
+    }
+    QPushButton[state="on"] {
+        background-color: #81A1C1;
+        color: #2E3440;
+    }
+    QPushButton[state="set"] {
+        background-color: #A3BE8C;
+        color: #2E3440;
+    }
+    QPushButton[state="alert"] {
+        background-color: #BF616A;
+        color: #ECEFF4;
+    }
+"""
+
+
+class CpuPageState:
+    # What the CPU page is set to, as plain fields rather than read back from
+    # widget stylesheets. The thresholds live in the page's CpuRules.
+    def __init__(self):
+        self.running = False
+        self.muted = False
+        self.shutdown_armed = False
 
 
 class CpuUsageWarner(QWidget):
-    def __init__(self):
+    def __init__(self, controller, sample_interval=SAMPLE_INTERVAL):
         super().__init__()
+        self.controller = controller
+        self.signals = SamplerSignals(self)
+        self.signals.sample.connect(self.cpu_o)
+        self.signals.cores.connect(self.cpu_cores)
+        self.adaptive = controller.adaptive_interval(sample_interval)
+        self.poll_timer = None
+        if controller.sampler_process and (controller.source is None or controller.source.live):
+            from cl_sampler import SharedSampler
+            cgroup = getattr(controller.source, 'cgroup', None)
+            self.sampler = SharedSampler(
+                sample_interval, self.cpu_o, self.cpu_cores, self.adaptive,
+                cgroup.path if cgroup is not None else None)
+            self.poll_timer = QTimer(self)
+            self.poll_timer.setInterval(int(self.sampler.poll_interval() * 1000))
+            self.poll_timer.timeout.connect(self.poll_sampler)
+        else:
+            self.sampler = CpuSampler(
+                sample_interval, self.signals.sample.emit, self.signals.cores.emit, self.adaptive,
+                controller.source)
+        self.show_extra = None  # built with the rest of the page
+        self.core_thresholds = None
+        self.processes = None
+        self.cpu_history = RingBuffer()
+        self.actions = controller.actions
+        self.action_signals = ActionSignals(self)
+        self.action_signals.done.connect(self.action_done)
+        self.pending_action = None
+        self.countdown_left = 0
+        self.countdown = QTimer(self)
+        self.countdown.setInterval(1000)
+        self.countdown.timeout.connect(self.count_down)
         self.initUI()
-        self.engine = pyttsx3.init()
-        self.voices = self.engine.getProperty('voices')
-        self.engine.setProperty('voice', self.voices[0].id)
-        self.rate = self.engine.getProperty('rate')
-        self.engine.setProperty('rate', self.rate - 2)
-        self.running = False
-        self.shut = 0
-        self.error_shown = False
-        self.cp1 = None
-        self.cp2 = None
-        self.cp3 = None
+        self.alerts = shared_speech_alerts()
+        self.state = CpuPageState()
+        self.view = PageView(self)
+        self.rules = CpuRules()
+        diagnostics = shared_diagnostics()
+        self.time_tick = diagnostics.timer('cpu_tick')
+        self.time_rules = diagnostics.timer('cpu_rules')
+        self.time_alert = diagnostics.timer('alert')
 
     def initUI(self):
         self.setWindowTitle('CPU Monitor')
         self.setGeometry(100, 100, 600, 400)
-        self.setStyleSheet("background-color: #2E3440; color: #D8DEE9;")
+        self.setStyleSheet(CPU_PAGE_STYLE)
 
         layout = QGridLayout()
         self.setLayout(layout)
@@ -336,25 +780,9 @@ class CpuUsageWarner(QWidget):
         self.setFont(font)
 
         self.cpu_button = QPushButton('CPU Errors', self)
-        self.cpu_button.setStyleSheet(self.button_style())
         self.cpu_button.clicked.connect(self.cpu_button_clicked)
         layout.addWidget(self.cpu_button, 0, 0, 1, 4)
 
-    def button_style(self):
-        return """
-            QPushButton {
-                background-color: #4C566A;
-                color: #ECEFF4;
-                border: 2px solid #81A1C1;
-                border-radius: 5px;
-                padding: 5px;
-            }
-            QPushButton:hover {
-                background-color: #81A1C1;
-                color: #2E3440;
-            }
-        """
-
     def cpu_button_clicked(self):
         self.clear_layout(self.layout())
 
@@ -378,7 +806,6 @@ class CpuUsageWarner(QWidget):
         self.layout().addWidget(self.cpu2_entry, 0, 1)
 
         self.cpu3_button = QPushButton('  |    ', self)
-        self.cpu3_button.setStyleSheet(self.button_style())
         self.cpu3_button.clicked.connect(self.first)
         self.layout().addWidget(self.cpu3_button, 0, 2)
 
@@ -395,7 +822,6 @@ class CpuUsageWarner(QWidget):
         self.layout().addWidget(self.cpu22_entry, 1, 1)
 
         self.cpu33_button = QPushButton('  |    ', self)
-        self.cpu33_button.setStyleSheet(self.button_style())
         self.cpu33_button.clicked.connect(self.last)
         self.layout().addWidget(self.cpu33_button, 1, 2)
 
@@ -412,7 +838,6 @@ class CpuUsageWarner(QWidget):
         self.layout().addWidget(self.cpu222_entry, 2, 1)
 
         self.cpu333_button = QPushButton('  |    ', self)
-        self.cpu333_button.setStyleSheet(self.button_style())
         self.cpu333_button.clicked.connect(self.end)
         self.layout().addWidget(self.cpu333_button, 2, 2)
 
@@ -420,30 +845,66 @@ class CpuUsageWarner(QWidget):
         self.error_label3.setStyleSheet("color: #BF616A; font-size: 12px;")
         self.layout().addWidget(self.error_label3, 2, 3)
 
-        self.cpu4_label = QLabel('Press this button to turn\n off the device if the last\n error occurs five times in a row:', self)
+        self.cpu4_label = QLabel(
+            f'Press this button to\n {self.actions.summary}\n if the end error occurs\n five times in a row:', self)
         self.cpu4_label.setStyleSheet(label_style)
         self.layout().addWidget(self.cpu4_label, 3, 1)
 
         self.cpu44_button = QPushButton('   |   \n   |__|   ', self)
-        self.cpu44_button.setStyleSheet(self.button_style())
         self.cpu44_button.clicked.connect(self.shu)
         self.layout().addWidget(self.cpu44_button, 3, 2)
 
         self.cpu_out_button = QPushButton('<<==exit', self)
-        self.cpu_out_button.setStyleSheet(self.button_style())
         self.cpu_out_button.clicked.connect(self.back_to_main)
         self.layout().addWidget(self.cpu_out_button, 0, 3)
 
         self.c_o_button = QPushButton(' o  |    ', self)
-        self.c_o_button.setStyleSheet(self.button_style())
         self.c_o_button.clicked.connect(self.c_o1)
         self.layout().addWidget(self.c_o_button, 4, 2)
 
         self.c_s_button = QPushButton('   🔊   ', self)
-        self.c_s_button.setStyleSheet(self.button_style())
         self.c_s_button.clicked.connect(self.suond)
         self.layout().addWidget(self.c_s_button, 2, 3)
 
+        self.show_c = QLabel('', self)
+        self.show_c.setStyleSheet("color: #ECEFF4; font-size: 12px;")
+        self.layout().addWidget(self.show_c, 4, 1)
+
+        self.c_p_button = QPushButton('Per core', self)
+        self.c_p_button.clicked.connect(self.per_core)
+        if not have_numpy():
+            self.c_p_button.setEnabled(False)
+            self.c_p_button.setToolTip('Per-core readings need numpy (pip install numpy)')
+        self.layout().addWidget(self.c_p_button, 4, 0)
+
+        self.show_cores = QLabel('', self)
+        self.show_cores.setStyleSheet("color: #ECEFF4; font-size: 12px;")
+        self.layout().addWidget(self.show_cores, 4, 3)
+
+        self.cpu_chart = Sparkline(self.cpu_history, "#88C0D0", 100, self)
+        self.layout().addWidget(self.cpu_chart, 5, 0, 1, 4)
+
+        self.c_t_button = QPushButton('Top processes', self)
+        self.c_t_button.clicked.connect(self.top_processes)
+        self.layout().addWidget(self.c_t_button, 6, 0)
+
+        self.show_top = QLabel('', self)
+        self.show_top.setStyleSheet("color: #ECEFF4; font-size: 12px;")
+        self.layout().addWidget(self.show_top, 6, 1, 1, 3)
+
+        self.show_action = QLabel('', self)
+        self.show_action.setStyleSheet("color: #BF616A; font-size: 12px;")
+        self.layout().addWidget(self.show_action, 7, 0, 1, 3)
+
+        self.cancel_button = QPushButton('Cancel', self)
+        self.cancel_button.clicked.connect(self.cancel_action)
+        self.cancel_button.hide()
+        self.layout().addWidget(self.cancel_button, 7, 3)
+
+        self.show_extra = QLabel('', self)
+        self.show_extra.setStyleSheet("color: #ECEFF4; font-size: 12px;")
+        self.layout().addWidget(self.show_extra, 8, 0, 1, 4)
+
     def clear_layout(self, layout):
         while layout.count():
             item = layout.takeAt(0)
@@ -452,191 +913,411 @@ class CpuUsageWarner(QWidget):
                 widget.deleteLater()
 
     def back_to_main(self):
-        self.main_window = MainWindow()
-        self.main_window.show()
-        self.close()
+        self.controller.open_main()
+
+    def closeEvent(self, event):
+        self.countdown.stop()  # a pending action is dropped with the window
+        if self.poll_timer is not None:
+            self.poll_timer.stop()
+        self.sampler.close()
+        super().closeEvent(event)
+
+    def set_button_state(self, button, state):
+        # Restyled by the page stylesheet's [state=...] rules, nothing is re-parsed
+        if button.property('state') == state:
+            return
+        button.setProperty('state', state)
+        button.style().unpolish(button)
+        button.style().polish(button)
 
     def suond(self):
-        if self.c_s_button.styleSheet() == self.button_style():
-            self.c_s_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #BF616A;
-                    color: #ECEFF4;
-                    border: 2px solid #81A1C1;
-                    border-radius: 5px;
-                    padding: 5px;
-                }
-            """)
-            self.c_s_button.setText('   🔈   ')
-        else:
-            self.c_s_button.setStyleSheet(self.button_style())
-            self.c_s_button.setText('   🔊   ')
+        self.state.muted = not self.state.muted
+        self.set_button_state(self.c_s_button, 'alert' if self.state.muted else '')
+        self.c_s_button.setText('   🔈   ' if self.state.muted else '   🔊   ')
 
     def shu(self):
-        if self.cpu44_button.styleSheet() == self.button_style():
-            self.cpu44_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #BF616A;
-                    color: #ECEFF4;
-                    border: 2px solid #81A1C1;
-                    border-radius: 5px;
-                    padding: 5px;
-                }
-            """)
-            self.shut = 1  # Enable shutdown feature
-        else:
-            self.cpu44_button.setStyleSheet(self.button_style())
-            self.shut = 0  # Disable shutdown feature
+        self.state.shutdown_armed = not self.state.shutdown_armed
+        self.set_button_state(self.cpu44_button, 'alert' if self.state.shutdown_armed else '')
+        if not self.state.shutdown_armed and self.countdown.isActive():
+            self.cancel_action()
 
     def first(self):
-        try:
-            cpu_value = int(self.cpu2_entry.text())
-            if cpu_value >= 100:
-                self.error_message("Please enter a number less than 100.", self.error_label1)
-                self.cpu3_button.setStyleSheet(self.button_style())
-                self.cpu3_button.setText('  |    ')
-                self.cp1 = None
-            else:
-                self.cpu3_button.setStyleSheet("""
-                    QPushButton {
-                        background-color: #A3BE8C;
-                        color: #2E3440;
-                        border: 2px solid #81A1C1;
-                        border-radius: 5px;
-                        padding: 5px;
-                    }
-                """)
-                self.cpu3_button.setText('    |  ')
-                self.error_label1.setText('')
-                self.cp1 = self.cpu2_entry.text()
-                self.error_shown = False
-        except ValueError:
-            self.error_message("Please enter a valid number.", self.error_label1)
+        self.apply_threshold(1, self.cpu2_entry, self.cpu3_button, self.error_label1)
 
     def last(self):
-        try:
-            cpu_value = int(self.cpu22_entry.text())
-            if cpu_value >= 100:
-                self.error_message("Please enter a number less than 100.", self.error_label2)
-                self.cpu33_button.setStyleSheet(self.button_style())
-                self.cpu33_button.setText('  |    ')
-                self.cp2 = None
-            else:
-                self.cpu33_button.setStyleSheet("""
-                    QPushButton {
-                        background-color: #A3BE8C;
-                        color: #2E3440;
-                        border: 2px solid #81A1C1;
-                        border-radius: 5px;
-                        padding: 5px;
-                    }
-                """)
-                self.cpu33_button.setText('    |  ')
-                self.error_label2.setText('')
-                self.cp2 = self.cpu22_entry.text()
-                self.error_shown = False
-        except ValueError:
-            self.error_message("Please enter a valid number.", self.error_label2)
+        self.apply_threshold(2, self.cpu22_entry, self.cpu33_button, self.error_label2)
 
     def end(self):
+        self.apply_threshold(3, self.cpu222_entry, self.cpu333_button, self.error_label3)
+
+    def apply_threshold(self, level, entry, button, error_label):
         try:
-            cpu_value = int(self.cpu222_entry.text())
-            if cpu_value >= 100:
-                self.error_message("Please enter a number less than 100.", self.error_label3)
-                self.cpu333_button.setStyleSheet(self.button_style())
-                self.cpu333_button.setText('  |    ')
-                self.cp3 = None
-            else:
-                self.cpu333_button.setStyleSheet("""
-                    QPushButton {
-                        background-color: #A3BE8C;
-                        color: #2E3440;
-                        border: 2px solid #81A1C1;
-                        border-radius: 5px;
-                        padding: 5px;
-                    }
-                """)
-                self.cpu333_button.setText('    |  ')
-                self.error_label3.setText('')
-                self.cp3 = self.cpu222_entry.text()
-                self.error_shown = False
+            cpu_value = int(entry.text())
         except ValueError:
-            self.error_message("Please enter a valid number.", self.error_label3)
-
-    def cpu_o(self):
-        if self.running:
-            cpu_usage = psutil.cpu_percent(interval=1)
-            show_c = QLabel(str(cpu_usage), self)
-            show_c.setStyleSheet("color: #ECEFF4; font-size: 12px;")
-            self.layout().addWidget(show_c, 4, 1)
-            if self.cp3 and cpu_usage >= int(self.cp3):
-                if not self.error_shown:
-                    self.shut += 1
-                    print(f"Shut count: {self.shut}")
-                    self.engine.setProperty('rate', self.rate + 30)
-                    if self.c_s_button.styleSheet() == self.button_style():
-                        self.speak('Warning: CPU usage is very high!')
-                    self.error_shown = True
-                    if self.shut >= 5 and self.shut == 1:
-                        if "background-color: #BF616A;" in self.cpu44_button.styleSheet():
-                            print('Shutting down...')
-                            os.system('shutdown /s /t 30')
-                            response = QMessageBox.question(
-                                self, "5 Errors in End Error",
-                                "Your system is shutting down. Push No to cancel.",
-                                QMessageBox.Yes | QMessageBox.No
-                            )
-                            if response == QMessageBox.No:
-                                os.system('shutdown /a')
-                            self.shut = 0
-            elif self.cp2 and cpu_usage >= int(self.cp2):
-                if not self.error_shown:
-                    if self.shut >= 1:
-                        self.shut -= 1
-                    if self.c_s_button.styleSheet() == self.button_style():
-                        self.speak('Warning: CPU usage is high!')
-                    self.error_shown = True
-            elif self.cp1 and cpu_usage >= int(self.cp1):
-                if not self.error_shown:
-                    if self.shut >= 1:
-                        self.shut -= 1
-                    if self.c_s_button.styleSheet() == self.button_style():
-                        self.speak('Warning: CPU usage is above threshold!')
-                    self.error_shown = True
-            else:
-                self.error_shown = False
-            QTimer.singleShot(1000, self.cpu_o)  # Check CPU usage every second
+            self.error_message("Please enter a valid number.", error_label)
+            return
+        if cpu_value >= 100:
+            self.error_message("Please enter a number less than 100.", error_label)
+            cpu_value = None
+        else:
+            error_label.setText('')
+        self.set_button_state(button, '' if cpu_value is None else 'set')
+        button.setText('  |    ' if cpu_value is None else '    |  ')
+        self.rules.set_threshold(level, cpu_value)
+        self.sync_limits()
+
+    def cpu_o(self, cpu_usage):
+        with self.time_tick:
+            self.show_sample(cpu_usage)
+
+    def show_sample(self, cpu_usage):
+        if self.state.running:
+            self.view.set_text(self.show_c, str(cpu_usage))
+            startup.mark("first_sample")
+            self.cpu_history.append(cpu_usage)
+            self.cpu_chart.update()
+            if self.processes is not None:
+                self.view.set_text(self.show_top, top_text(self.processes.leaders))
+            with self.time_rules:
+                level = self.rules.evaluate(cpu_usage)
+            if self.adaptive is not None:
+                self.view.set_tooltip(
+                    self.show_c, f"Next sample in {self.adaptive.current:.2f} s, "
+                    f"{int(self.adaptive.wakeups_saved)} wakeups saved")
+                self.controller.publish_wakeups_saved()
+            if self.controller.metrics is not None:
+                self.controller.metrics.update(cpu=cpu_usage)
+                if level:
+                    self.controller.metrics.count_alert('cpu', CPU_LEVELS[level][1])
+            if self.controller.history is not None:
+                self.controller.history.record('cpu', cpu_usage)
+                if level:
+                    self.controller.history.record_event(
+                        'cpu', CPU_LEVELS[level][1], cpu_alert_text(level) + self.top_suffix())
+            if level and not self.state.muted:
+                self.speak('cpu', CPU_LEVELS[level][1], cpu_alert_text(level) + self.top_suffix(1))
+            if self.rules.shutdown_due() and self.state.shutdown_armed and self.pending_action is None:
+                self.arm_action(cpu_usage)
+                self.rules.end_streak = 0
+
+    def arm_action(self, cpu_usage):
+        # A countdown on the page rather than a modal dialog, so sampling
+        # carries on while the action is pending and Cancel stops it
+        leaders = self.processes.leaders if self.processes is not None else ()
+        try:
+            self.pending_action = self.actions.plan(cpu_usage, leaders)
+        except ValueError as exc:
+            self.view.set_text(self.show_action, str(exc))
+            return
+        self.countdown_left = self.actions.delay
+        self.cancel_button.show()
+        self.show_countdown()
+        self.countdown.start()
+
+    def show_countdown(self):
+        dry = " (dry run)" if self.actions.dry_run else ''
+        self.view.set_text(
+            self.show_action, f"{self.pending_action.description} in {self.countdown_left} s{dry}")
+
+    def count_down(self):
+        self.countdown_left -= 1
+        if self.countdown_left > 0:
+            self.show_countdown()
+            return
+        self.countdown.stop()
+        self.cancel_button.hide()
+        self.view.set_text(self.show_action, f"Running {self.pending_action.description}...")
+        started = self.actions.run_soon(
+            self.pending_action, lambda planned, ok, message: self.action_signals.done.emit(ok, message))
+        if not started:
+            self.action_done(False, "the previous action is still running")
+
+    def cancel_action(self):
+        self.countdown.stop()
+        self.cancel_button.hide()
+        self.pending_action = None
+        self.view.set_text(self.show_action, "Cancelled")
+
+    def action_done(self, ok, message):
+        self.pending_action = None
+        self.view.set_text(self.show_action, message if ok else f"Failed: {message}")
+        if self.controller.history is not None:
+            self.controller.history.record_event('action', 'end', message)
+
+    def show_extras(self, readings):
+        if self.show_extra is not None:
+            self.view.set_text(self.show_extra, extras_text(readings))
+
+    def per_core(self):
+        if self.sampler.percpu:
+            self.sampler.percpu = False
+            self.set_button_state(self.c_p_button, '')
+            self.view.set_text(self.show_cores, '')
+        else:
+            if self.core_thresholds is None:
+                self.core_thresholds = CoreThresholds()
+                self.sync_limits()
+            self.sampler.percpu = True
+            self.set_button_state(self.c_p_button, 'on')
+
+    def top_processes(self):
+        # Reading processes only makes sense against live CPU readings
+        if self.controller.source is not None and not self.controller.source.live:
+            return
+        if self.processes is not None:
+            self.processes = self.sampler.processes = None
+            self.set_button_state(self.c_t_button, '')
+            self.view.set_text(self.show_top, '')
+        elif self.poll_timer is not None:
+            from cl_sampler import SharedLeaders
+            self.processes = self.sampler.processes = SharedLeaders()  # scanned by the child
+            self.set_button_state(self.c_t_button, 'on')
+        else:
+            self.processes = self.sampler.processes = ProcessTop(
+                pids=getattr(self.controller.source, 'pids', None))
+            self.set_button_state(self.c_t_button, 'on')
+
+    def top_suffix(self, limit=3):
+        if self.processes is None or not self.processes.leaders:
+            return ''
+        return f" Top: {top_text(self.processes.leaders, limit)}"
+
+    def sync_limits(self):
+        self.sampler.thresholds = tuple(self.rules.thresholds)
+        if self.core_thresholds is not None:
+            for level, value in enumerate(self.rules.thresholds, 1):
+                self.core_thresholds.set_limit(level, value)
+
+    def cpu_cores(self, percents):
+        # Per-core alerts are spoken only; the shutdown counter follows the total
+        if not self.state.running or not self.sampler.percpu:
+            return
+        hottest = int(percents.argmax())
+        self.view.set_text(self.show_cores, f"core {hottest}: {percents[hottest]}")
+        level, cores = self.core_thresholds.evaluate(percents)
+        if self.controller.metrics is not None:
+            self.controller.metrics.update(cores=percents.tolist())
+            if level:
+                self.controller.metrics.count_alert('core', CPU_LEVELS[level][1])
+        if self.controller.history is not None:
+            self.controller.history.record('cpu_core_max', float(percents[hottest]))
+            if level:
+                self.controller.history.record_event(
+                    'core', CPU_LEVELS[level][1], cpu_alert_text(level, cores) + self.top_suffix())
+        if level and not self.state.muted:
+            self.speak('core', CPU_LEVELS[level][1], cpu_alert_text(level, cores) + self.top_suffix(1))
 
     def c_o1(self):
-        if self.running:
-            self.running = False
-            self.c_o_button.setStyleSheet(self.button_style())
+        if self.state.running:
+            self.state.running = False
+            self.sampler.stop()
+            if self.countdown.isActive():
+                self.cancel_action()  # nothing is watching the CPU any more
+            if self.poll_timer is not None:
+                self.poll_timer.stop()
+            self.set_button_state(self.c_o_button, '')
             self.c_o_button.setText(' o  |    ')
         else:
-            self.running = True
-            self.c_o_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #81A1C1;
-                    color: #2E3440;
-                    border: 2px solid #81A1C1;
-                    border-radius: 5px;
-                    padding: 5px;
-                }
-            """)
+            self.state.running = True
+            self.set_button_state(self.c_o_button, 'on')
             self.c_o_button.setText('    |  - ')
-            self.cpu_o()
+            self.sampler.start()
+            if self.poll_timer is not None:
+                self.poll_timer.start()
+
+    def poll_sampler(self):
+        # Follows the sampling interval, which the user or the adaptive schedule may have changed
+        self.sampler.poll()
+        interval = int(self.sampler.poll_interval() * 1000)
+        if interval != self.poll_timer.interval():
+            self.poll_timer.setInterval(interval)
 
     def error_message(self, message, label):
         label.setText(message)
         QTimer.singleShot(3000, lambda: label.setText(''))
 
-    def speak(self, text):
-        self.engine.say(text)
-        self.engine.runAndWait()
+    def speak(self, kind, severity, text):
+        with self.time_alert:
+            self.alerts.post(kind, severity, text)
+
+
+class DiagnosticsPage(QWidget):
+    # Live view of the self-instrumentation histograms
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+        self.diagnostics = shared_diagnostics()
+        self.export_job = None
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('Diagnostics')
+        self.setFixedSize(620, 420)
+        self.setStyleSheet("background-color: #2E3440; color: #D8DEE9;")
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        self.report_label = QLabel('', self)
+        self.report_label.setFont(QFont("Courier New", 9))
+        self.report_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        self.report_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(self.report_label, 1)
+
+        button_style = """
+            QPushButton {
+                background-color: #4C566A;
+                color: #ECEFF4;
+                border: 2px solid #81A1C1;
+                border-radius: 5px;
+                padding: 5px;
+            }
+            QPushButton:hover {
+                background-color: #81A1C1;
+                color: #2E3440;
+            }
+            QPushButton:disabled {
+                color: #4C566A;
+            }
+        """
+
+        self.export_label = QLabel('' if self.controller.history is not None else
+                                   'Start CL Center with --history to record data for export.', self)
+        layout.addWidget(self.export_label)
+
+        self.export_button = QPushButton('Export history...', self)
+        self.export_button.setStyleSheet(button_style)
+        self.export_button.setEnabled(self.controller.history is not None)
+        self.export_button.clicked.connect(self.export_history)
+        layout.addWidget(self.export_button)
+
+        self.back_button = QPushButton('<<==exit', self)
+        self.back_button.setStyleSheet(button_style)
+        self.back_button.clicked.connect(self.controller.open_main)
+        layout.addWidget(self.back_button)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def export_history(self):
+        # Streams the history database to a file on a background thread; the
+        # page polls its progress on the refresh timer
+        if self.export_job is not None and self.export_job.running:
+            self.export_job.cancel()
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export history", "cl_center_history.csv",
+            "CSV (*.csv);;Compressed CSV (*.csv.gz);;Parquet (*.parquet)")
+        if not path:
+            return
+        from cl_export import ExportJob
+        self.export_job = ExportJob(path, history=self.controller.history.path)
+        self.export_job.start()
+        self.export_button.setText('Cancel export')
+        self.show_export()
+
+    def show_export(self):
+        job = self.export_job
+        if job is None:
+            return
+        if job.running:
+            self.export_label.setText(f"Exporting to {job.output}: {job.rows} rows")
+            return
+        if job.error is not None:
+            self.export_label.setText(f"Export failed: {job.error}")
+        elif job.cancelled:
+            self.export_label.setText("Export cancelled")
+        else:
+            self.export_label.setText(f"Exported {job.rows} rows to {job.output}")
+        self.export_button.setText('Export history...')
+        self.export_job = None
+
+    def refresh(self):
+        self.report_label.setText(self.diagnostics.report())
+        self.show_export()
+
+    def showEvent(self, event):
+        self.controller.lag_probe.start()
+        self.refresh()
+        self.timer.start(1000)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        if self.controller.metrics is None:
+            self.controller.lag_probe.stop()
+        super().hideEvent(event)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    main_window = MainWindow()
-    main_window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    parser = argparse.ArgumentParser(prog="CL Center")
+    parser.add_argument('--startup-timing', action='store_true')
+    parser.add_argument('--metrics-port', type=int)
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--history', nargs='?', const='')
+    parser.add_argument('--interval', type=float, default=SAMPLE_INTERVAL)
+    parser.add_argument('--adaptive', action='store_true')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL)
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL)
+    parser.add_argument('--cgroup', nargs='?', const='')
+    parser.add_argument('--sampler-process', action='store_true')
+    parser.add_argument('--action', choices=sorted(ACTIONS), default='shutdown')
+    parser.add_argument('--action-hook')
+    parser.add_argument('--action-delay', type=int, default=ACTION_DELAY)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--extra', action='store_true')
+    parser.add_argument('--metric-limit', action='append', default=[])
+    options, qt_args = parser.parse_known_args()
+    if options.interval <= 0:
+        parser.error("--interval must be positive")
+    if not 0 < options.min_interval <= options.max_interval:
+        parser.error("need 0 < --min-interval <= --max-interval")
+    startup.enabled = options.startup_timing
+    metrics = None
+    if options.metrics_port is not None:
+        from cl_exporter import MetricsSnapshot, MetricsExporter
+        metrics = MetricsSnapshot(shared_diagnostics())
+        MetricsExporter(metrics, options.metrics_host, options.metrics_port).start()
+    history = None
+    if options.history is not None:
+        from cl_store import HISTORY_PATH, MetricStore
+        history = MetricStore(options.history or HISTORY_PATH)
+    app = QApplication(sys.argv[:1] + qt_args)
+    if hasattr(signal, 'SIGUSR1'):
+        # Dumped as soon as the signal arrives; the wakeup gets an idle
+        # event loop back into Python to run the handler
+        signal.signal(signal.SIGUSR1, lambda *_: shared_diagnostics().dump())
+        wakeup = SignalWakeup(app)
+    adaptive = (options.min_interval, options.max_interval) if options.adaptive else None
+    source = None
+    if options.cgroup is not None:
+        from cl_cgroups import CgroupSource
+        try:
+            source = CgroupSource(options.cgroup or None)
+        except (OSError, ValueError) as exc:
+            parser.error(f"cannot read cgroup: {exc}")
+    try:
+        actions = ActionExecutor(options.action, options.action_hook, options.dry_run, max(1, options.action_delay))
+    except ValueError as exc:
+        parser.error(str(exc))
+    limits = {}
+    for text in options.metric_limit:
+        try:
+            name, levels = parse_limit(text)
+        except ValueError as exc:
+            parser.error(f"--metric-limit {text}: {exc}")
+        limits[name] = levels
+    extras = None
+    if options.extra or limits:
+        extras = SystemMetrics(EXTRA_METRICS if options.extra else limits, limits)
+    control_center = ControlCenter(
+        metrics, history, adaptive, source, options.sampler_process, actions, extras, options.interval)
+    control_center.show()
+    QTimer.singleShot(0, lambda: startup.mark("first_window"))
+    sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,143 @@
+# Protective actions for when CPU usage stays at the end threshold: shut
+# down or suspend the machine, lower the priority of or pause the busiest
+# process, or run a hook script. Actions run on a worker thread, commands
+# through subprocess with a timeout, so monitoring never waits on them.
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+
+ACTIONS = {
+    # name -> what the button arms, as shown on the CPU page
+    'shutdown': "turn off the device",
+    'suspend': "suspend the device",
+    'renice': "lower the priority of the busiest process",
+    'stop': "pause the busiest process",
+    'hook': "run the hook script",
+}
+ACTION_DELAY = 30  # seconds of countdown before the action runs
+ACTION_TIMEOUT = 30.0
+
+
+def power_command(kind, platform=sys.platform):
+    # The command that shuts down or suspends this machine right away
+    if platform.startswith('win'):
+        if kind == 'shutdown':
+            return ['shutdown', '/s', '/t', '0']
+        return ['rundll32.exe', 'powrprof.dll,SetSuspendState', '0,1,0']
+    if platform == 'darwin':
+        return ['shutdown', '-h', 'now'] if kind == 'shutdown' else ['pmset', 'sleepnow']
+    if shutil.which('systemctl'):
+        return ['systemctl', 'poweroff' if kind == 'shutdown' else 'suspend']
+    return ['shutdown', '-h', 'now'] if kind == 'shutdown' else ['pm-suspend']
+
+
+def renice(pid):
+    if hasattr(os, 'setpriority'):
+        os.setpriority(os.PRIO_PROCESS, pid, 19)
+    else:
+        import psutil
+        psutil.Process(pid).nice(psutil.IDLE_PRIORITY_CLASS)
+
+
+def pause(pid):
+    if hasattr(signal, 'SIGSTOP'):
+        os.kill(pid, signal.SIGSTOP)
+    else:
+        import psutil
+        psutil.Process(pid).suspend()
+
+
+class PlannedAction:
+    # One action against one alert: a command to run or a function to call,
+    # with the text shown in the countdown and the log
+    def __init__(self, name, description, command=None, function=None, env=None):
+        self.name = name
+        self.description = description
+        self.command = command
+        self.function = function
+        self.env = env
+
+
+class ActionExecutor:
+    # plan() decides what the configured action would do right now; run_soon()
+    # carries it out on a worker thread and reports (planned, ok, message) to
+    # on_done from that thread. One action runs at a time.
+    def __init__(self, action='shutdown', hook=None, dry_run=False, delay=ACTION_DELAY, timeout=ACTION_TIMEOUT):
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action!r}")
+        if action == 'hook' and not hook:
+            raise ValueError("the hook action needs a script")
+        self.action = action
+        self.hook = hook
+        self.dry_run = dry_run
+        self.delay = delay
+        self.timeout = timeout
+        self.thread = None
+
+    @property
+    def summary(self):
+        return ACTIONS[self.action]
+
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def target(self, leaders):
+        # The busiest process that is neither this one nor init
+        for percent, pid, name in leaders:
+            if pid not in (0, 1, os.getpid()):
+                return pid, name
+        raise ValueError("no busy process is known; turn on Top processes first")
+
+    def plan(self, cpu=None, leaders=()):
+        if self.action in ('shutdown', 'suspend'):
+            command = power_command(self.action)
+            return PlannedAction(self.action, f"{self.action}: {' '.join(command)}", command)
+        if self.action == 'hook':
+            env = dict(os.environ, CL_CENTER_CPU='' if cpu is None else str(cpu))
+            if leaders:
+                percent, pid, name = leaders[0]
+                env.update(CL_CENTER_TOP_PID=str(pid), CL_CENTER_TOP_NAME=name)
+            return PlannedAction('hook', f"hook: {self.hook}", [self.hook], env=env)
+        pid, name = self.target(leaders)
+        if self.action == 'renice':
+            return PlannedAction('renice', f"renice {name} ({pid})", function=lambda: renice(pid))
+        return PlannedAction('stop', f"pause {name} ({pid})", function=lambda: pause(pid))
+
+    def run(self, planned):
+        # Returns (ok, message); never raises
+        if self.dry_run:
+            return True, f"dry run, would {planned.description}"
+        if planned.function is not None:
+            try:
+                planned.function()
+            except Exception as exc:  # OSError, psutil.Error, a missing psutil
+                return False, f"{planned.description} failed: {exc}"
+            return True, planned.description
+        try:
+            done = subprocess.run(planned.command, env=planned.env, stdin=subprocess.DEVNULL,
+                                  capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return False, f"{planned.description} timed out after {self.timeout:g} s"
+        except OSError as exc:
+            return False, f"{planned.description} failed: {exc}"
+        if done.returncode:
+            detail = (done.stderr or done.stdout).strip().splitlines()
+            return False, f"{planned.description} exited with {done.returncode}" + (f": {detail[-1]}" if detail else '')
+        return True, planned.description
+
+    def run_soon(self, planned, on_done=None):
+        if self.busy:
+            return False
+
+        def work():
+            ok, message = self.run(planned)
+            if on_done is not None:
+                on_done(planned, ok, message)
+
+        self.thread = threading.Thread(target=work, name=f"action-{planned.name}", daemon=True)
+        self.thread.start()
+        return True
@@ -0,0 +1,248 @@
+# Benchmark and soak test for the Qt monitors. Drives CpuUsageWarner and
+# InternetUsageMonitor offscreen from a synthetic source and prints JSON
+# results that can be diffed against an earlier run with --compare.
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentiles(samples):
+    if not samples:
+        return {'n': 0}
+    ordered = sorted(samples)
+
+    def ms(seconds):
+        return round(seconds * 1000, 4)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        'n': len(ordered),
+        'mean_ms': ms(sum(ordered) / len(ordered)),
+        'p50_ms': ms(pick(0.50)),
+        'p95_ms': ms(pick(0.95)),
+        'p99_ms': ms(pick(0.99)),
+        'max_ms': ms(ordered[-1]),
+    }
+
+
+def rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, not current
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location('cl_center_app', os.path.join(HERE, 'CL Center.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(args):
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'hours': args.hours,
+        'interval': args.interval,
+    }
+    started = time.perf_counter()
+    app_module = load_app()
+    from PyQt5.QtCore import QEventLoop, Qt, QTimer
+    from PyQt5.QtWidgets import QApplication
+    from cl_core import CpuReader
+    from cl_sources import SyntheticSource
+
+    qt = QApplication.instance() or QApplication(sys.argv[:1])
+    source = SyntheticSource(seed=args.seed)
+    center = app_module.ControlCenter(source=source)
+    center.show()
+    qt.processEvents()
+    results['startup'] = {'first_window_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    started = time.perf_counter()
+    center.open_cpu_usage()
+    cpu = center.currentWidget()
+    cpu.cpu_button_clicked()
+    cpu.suond()  # muted, so no speech engine is involved
+    for level, value in enumerate((60, 75, 90), 1):
+        cpu.rules.set_threshold(level, value)
+    cpu.sync_limits()
+    cpu.state.running = True  # samples are fed in below rather than by the sampler thread
+    center.open_internet_usage()
+    net = center.currentWidget()
+    net.timer.stop()
+    net.usage_limit = 1e12  # never reached, so no message box
+    net.net.set_limit(net.usage_limit)
+    qt.processEvents()
+    results['startup']['pages_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    reader = CpuReader(source)
+    reader.read()
+
+    def tick(cpu_times, net_times):
+        source.step(args.interval)
+        value, _ = reader.read()
+        start = time.perf_counter()
+        cpu.cpu_o(value)
+        cpu_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        net.update_usage()
+        net_times.append(time.perf_counter() - start)
+
+    # Soak: simulated hours, one tick per interval, events processed between ticks
+    cpu_times, net_times = [], []
+    marks = [rss()]
+    ticks_per_hour = max(1, int(3600 / args.interval))
+    for _ in range(args.hours):
+        for _ in range(ticks_per_hour):
+            tick(cpu_times, net_times)
+            qt.processEvents()
+        marks.append(rss())
+    results['cpu_tick'] = percentiles(cpu_times)
+    results['net_tick'] = percentiles(net_times)
+    if len(marks) > 2:  # leave out the first hour, which includes warm-up allocations
+        growth = (marks[-1] - marks[1]) / (len(marks) - 2)
+    else:
+        growth = marks[-1] - marks[0]
+    results['rss'] = {
+        'start_bytes': marks[0],
+        'end_bytes': marks[-1],
+        'hourly_bytes': marks,
+        'growth_per_hour_bytes': round(growth),
+    }
+
+    # Event-loop lag: a precise probe timer runs while ticks are driven through the loop
+    lag = []
+    period = args.probe_ms / 1000
+    due = [time.perf_counter() + period]
+
+    def probe():
+        now = time.perf_counter()
+        lag.append(max(0.0, now - due[0]))
+        due[0] = now + period
+
+    probe_timer = QTimer()
+    probe_timer.setTimerType(Qt.PreciseTimer)
+    probe_timer.timeout.connect(probe)
+    drive_timer = QTimer()
+    drive_timer.timeout.connect(lambda: tick([], []))
+    loop = QEventLoop()
+    probe_timer.start(args.probe_ms)
+    drive_timer.start(args.drive_ms)
+    QTimer.singleShot(int(args.lag_seconds * 1000), loop.quit)
+    loop.exec_()
+    probe_timer.stop()
+    drive_timer.stop()
+    results['loop_lag'] = percentiles(lag)
+
+    center.close()
+    return results
+
+
+def bench_sources(reads):
+    # Cost of one read of each live counter, psutil against the /proc fast path
+    from cl_sources import ProcfsSource, PsutilSource
+    results = {}
+    for name, make in (('psutil', PsutilSource), ('procfs', ProcfsSource)):
+        try:
+            source = make()
+        except (ImportError, OSError) as exc:
+            results[name] = {'error': str(exc)}
+            continue
+        calls = {
+            'cpu_times': source.cpu_times,
+            'cpu_times_percpu': lambda: source.cpu_times(percpu=True),
+            'net_io_counters': source.net_io_counters,
+        }
+        results[name] = {}
+        for call, read in calls.items():
+            samples = []
+            for _ in range(reads):
+                start = time.perf_counter()
+                read()
+                samples.append(time.perf_counter() - start)
+            results[name][call] = percentiles(samples)
+        if hasattr(source, 'close'):
+            source.close()
+    if 'error' not in results['psutil'] and 'error' not in results['procfs']:
+        results['speedup'] = {
+            call: round(results['psutil'][call]['mean_ms'] / results['procfs'][call]['mean_ms'], 2)
+            for call in results['procfs']
+        }
+    return results
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def compare(old, new):
+    before = dict(flatten(old))
+    lines = [f"{'metric':40} {'before':>14} {'after':>14} {'change':>9}"]
+    for name, value in flatten(new):
+        if name not in before:
+            continue
+        change = f"{(value - before[name]) / before[name] * 100:+.1f}%" if before[name] else ''
+        lines.append(f"{name:40} {before[name]:>14} {value:>14} {change:>9}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cl_bench", description="Benchmark the CL Center monitors.")
+    parser.add_argument('--hours', type=int, default=1, help="simulated hours for the soak test")
+    parser.add_argument('--interval', type=float, default=1.0, help="simulated seconds per tick")
+    parser.add_argument('--lag-seconds', type=float, default=5.0, help="wall time for the event-loop lag probe")
+    parser.add_argument('--probe-ms', type=int, default=10, help="lag probe period")
+    parser.add_argument('--drive-ms', type=int, default=20, help="tick period during the lag probe")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sources', action='store_true',
+                        help="only time the live counter reads (psutil and /proc), without Qt")
+    parser.add_argument('--reads', type=int, default=20000, help="reads per call for --sources")
+    parser.add_argument('--output', '-o', help="write the JSON results here as well as to stdout")
+    parser.add_argument('--compare', metavar='OLD_JSON', help="print the change against an earlier result")
+    args = parser.parse_args(argv)
+
+    if args.sources:
+        results = {'commit': git_commit(), 'python': platform.python_version(),
+                   'platform': platform.platform(), 'sources': bench_sources(args.reads)}
+    else:
+        results = run(args)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), results), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
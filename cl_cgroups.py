@@ -0,0 +1,291 @@
+# cgroup v2 readings, so thresholds and limits can apply to one workload
+# (a container, a systemd service) instead of the whole host. Linux only.
+import os
+import re
+import time
+from fnmatch import fnmatch
+
+from cl_sources import ModelCpuTimes, ProcNetDev, parse_btime
+
+CAPACITY_EVERY = 30.0  # seconds between re-reads of cpu.max and the cpuset
+NETNS_EVERY = 30.0  # seconds between looks for a member outside the host's network namespace
+
+
+def cgroup2_root(mountinfo='/proc/self/mountinfo'):
+    # Where the cgroup v2 hierarchy is mounted: /sys/fs/cgroup on unified
+    # hosts, usually /sys/fs/cgroup/unified on hybrid ones
+    with open(mountinfo) as f:
+        for line in f:
+            fields, dash, rest = line.partition(' - ')
+            if dash and rest.split(None, 1)[0] == 'cgroup2':
+                point = fields.split()[4]
+                return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), point)  # a space is \040
+    raise OSError("no cgroup v2 hierarchy is mounted")
+
+
+def own_cgroup():
+    # The cgroup v2 path of this process, e.g. /system.slice/foo.service
+    with open('/proc/self/cgroup') as f:
+        for line in f:
+            if line.startswith('0::'):
+                return line[3:].strip()
+    raise OSError("this process is not in a cgroup v2 hierarchy")
+
+
+def cpu_list_size(text):
+    # Number of CPUs in a list such as "0-3,6"
+    count = 0
+    for part in text.strip().split(','):
+        if '-' in part:
+            low, high = part.split('-')
+            count += int(high) - int(low) + 1
+        elif part:
+            count += 1
+    return count
+
+
+class Cgroup:
+    # One cgroup with its cpu.stat kept open. capacity is the number of cores
+    # it may use: the tightest cpu.max quota on the way up to the root, the
+    # cpuset, or every core.
+    def __init__(self, root, path):
+        self.root = root
+        self.path = '/' + path.strip('/')
+        self.dir = os.path.join(root, path.strip('/'))
+        self.stat_fd = os.open(os.path.join(self.dir, 'cpu.stat'), os.O_RDONLY)
+        self.buffer = bytearray(1024)
+        self.capacity = self.read_capacity()
+        self.capacity_read = time.monotonic()
+        self.prev = None  # (usage seconds, monotonic time) at the last scan
+
+    def read_capacity(self):
+        cores = os.cpu_count() or 1
+        try:
+            with open(os.path.join(self.dir, 'cpuset.cpus.effective')) as f:
+                cores = min(cores, cpu_list_size(f.read()) or cores)
+        except (OSError, ValueError):
+            pass
+        directory = self.dir
+        while True:
+            try:
+                with open(os.path.join(directory, 'cpu.max')) as f:
+                    quota, period = f.read().split()
+                if quota != 'max':
+                    cores = min(cores, int(quota) / int(period))
+            except (OSError, ValueError):
+                pass
+            if os.path.samefile(directory, self.root):
+                return cores
+            directory = os.path.dirname(directory)
+
+    def refresh_capacity(self, now):
+        if now - self.capacity_read >= CAPACITY_EVERY:
+            self.capacity = self.read_capacity()
+            self.capacity_read = now
+
+    def usage(self):
+        # CPU seconds used so far, from the usage_usec line of cpu.stat
+        buffer = self.buffer
+        size = os.preadv(self.stat_fd, [buffer], 0)
+        start = buffer.index(b'usage_usec ', 0, size) + 11
+        return int(buffer[start:buffer.index(b'\n', start, size)]) / 1e6
+
+    def percent(self):
+        # Usage since the last call as a share of capacity; None the first time
+        now = time.monotonic()
+        used = self.usage()
+        prev, self.prev = self.prev, (used, now)
+        self.refresh_capacity(now)
+        if prev is None or now <= prev[1]:
+            return None
+        share = (used - prev[0]) / ((now - prev[1]) * self.capacity)
+        return round(max(0.0, min(100.0, 100.0 * share)), 1)
+
+    def members(self):
+        # Pids in this cgroup and every cgroup below it: an interior node
+        # such as system.slice holds no processes of its own
+        for directory, subdirs, files in os.walk(self.dir):
+            try:
+                with open(os.path.join(directory, 'cgroup.procs'), 'rb') as f:
+                    for line in f:
+                        if line.strip():
+                            yield int(line)
+            except (OSError, ValueError):
+                continue  # removed while walking
+
+    def pids(self):
+        return list(self.members())
+
+    def pid(self):
+        # Any one member, to find the network namespace; None when empty
+        return next(self.members(), None)
+
+    def close(self):
+        os.close(self.stat_fd)
+
+
+def namespace_net_dev(pid):
+    # Counters of pid's network namespace, read through that process; once
+    # it is gone the file fails and is reopened through another member
+    return ProcNetDev(f'/proc/{pid}/net/dev')
+
+
+def netns_id(pid):
+    return os.stat(f'/proc/{pid}/ns/net').st_ino
+
+
+class CgroupSource:
+    # Monitor one cgroup with the usual CPU page and thresholds. CPU times
+    # are its busy seconds against the seconds its capacity allowed, so the
+    # CPU percentage is relative to the quota; network counters are those
+    # of the namespace its processes are in, or none when they share this
+    # process's namespace, since those would be the host's.
+    live = True
+
+    def __init__(self, path=None, root=None):
+        self.cgroup = Cgroup(root or cgroup2_root(), own_cgroup() if path is None else path)
+        self.state_key = self.cgroup.path
+        self.base = self.cgroup.usage()
+        self.allowed = 0.0
+        self.last = time.monotonic()
+        self.netns = None
+        self.own_netns = netns_id('self')
+        self.netns_looked = None  # monotonic time of the last look that found only the host's namespace
+        with open('/proc/stat', 'rb') as f:
+            self.btime = parse_btime(f.read())
+
+    def cpu_times(self, percpu=False):
+        # cgroup v2 has no per-CPU usage, so percpu reports the cgroup as one core
+        now = time.monotonic()
+        self.cgroup.refresh_capacity(now)
+        self.allowed += self.cgroup.capacity * (now - self.last)
+        self.last = now
+        busy = self.cgroup.usage() - self.base
+        times = ModelCpuTimes(busy, self.allowed - busy)
+        return [times] if percpu else times
+
+    def net_io_counters(self):
+        if self.netns is not None:
+            try:
+                return self.netns.read()
+            except OSError:
+                self.netns.close()
+                self.netns = None
+        now = time.monotonic()
+        if self.netns_looked is not None and now - self.netns_looked < NETNS_EVERY:
+            return {}
+        for pid in self.cgroup.members():
+            try:
+                if netns_id(pid) == self.own_netns:
+                    continue
+                self.netns = namespace_net_dev(pid)
+                self.netns_looked = None
+                return self.netns.read()
+            except OSError:
+                continue  # exited in the meantime
+        self.netns_looked = now
+        return {}
+
+    def pids(self):
+        return self.cgroup.pids()
+
+    def boot_time(self):
+        return self.btime
+
+    def time(self):
+        return time.time()
+
+    def close(self):
+        self.cgroup.close()
+        if self.netns is not None:
+            self.netns.close()
+
+
+class CgroupScanner:
+    # Usage of every cgroup under root whose path matches one of patterns,
+    # in one pass: cpu.stat handles stay open between scans, and each network
+    # namespace is read once however many cgroups share it. Cgroups in this
+    # process's own namespace get no network figures, since those are the
+    # host's. The tree is listed again every rescan_every seconds.
+    def __init__(self, patterns=('*',), root=None, rescan_every=30.0):
+        self.patterns = patterns
+        self.root = root or cgroup2_root()
+        self.rescan_every = rescan_every
+        self.cgroups = {}  # path -> Cgroup
+        self.netns_of = {}  # path -> namespace inode
+        self.namespaces = {}  # inode -> ProcNetDev
+        self.own_netns = netns_id('self')
+        self.listed = None
+
+    def wanted(self, path):
+        return any(fnmatch(path, pattern) or fnmatch(path.lstrip('/'), pattern) for pattern in self.patterns)
+
+    def discover(self):
+        found = set()
+        for directory, subdirs, files in os.walk(self.root):
+            if 'cpu.stat' not in files:
+                continue
+            relative = os.path.relpath(directory, self.root)
+            path = '/' if relative == '.' else '/' + relative.replace(os.sep, '/')
+            if not self.wanted(path):
+                continue
+            found.add(path)
+            if path not in self.cgroups:
+                try:
+                    self.cgroups[path] = Cgroup(self.root, path)
+                except OSError:
+                    found.discard(path)
+                    continue
+        for path in [path for path in self.cgroups if path not in found]:
+            self.cgroups.pop(path).close()
+        self.netns_of = {}
+        members = {}
+        for path, cgroup in self.cgroups.items():
+            pid = cgroup.pid()
+            if pid is None:
+                continue
+            try:
+                inode = netns_id(pid)
+            except OSError:
+                continue
+            if inode != self.own_netns:
+                self.netns_of[path] = inode
+                members.setdefault(inode, pid)
+        for inode in [inode for inode in self.namespaces if inode not in members]:
+            self.namespaces.pop(inode).close()
+        for inode, pid in members.items():
+            if inode not in self.namespaces:
+                try:
+                    self.namespaces[inode] = namespace_net_dev(pid)
+                except OSError:
+                    pass
+        self.listed = time.monotonic()
+
+    def scan(self):
+        # Returns {path: (cpu percent or None, net counters or None)}
+        if self.listed is None or time.monotonic() - self.listed >= self.rescan_every:
+            self.discover()
+        counters = {}
+        for inode, namespace in list(self.namespaces.items()):
+            try:
+                counters[inode] = namespace.read()
+            except OSError:
+                self.namespaces.pop(inode).close()
+                self.listed = None  # find another member next time
+        readings = {}
+        for path, cgroup in list(self.cgroups.items()):
+            try:
+                cpu = cgroup.percent()
+            except (OSError, ValueError):
+                self.cgroups.pop(path).close()  # removed since the last listing
+                continue
+            readings[path] = (cpu, counters.get(self.netns_of.get(path)))
+        return readings
+
+    def close(self):
+        for cgroup in self.cgroups.values():
+            cgroup.close()
+        for namespace in self.namespaces.values():
+            namespace.close()
+        self.cgroups = {}
+        self.namespaces = {}
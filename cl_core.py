@@ -0,0 +1,751 @@
+# Sampling, accounting and alert logic shared by the Qt window and the
+# headless monitor. Nothing in here imports Qt.
+import time
+import threading
+import json
+import importlib.util
+from array import array
+from collections import deque
+from fnmatch import fnmatch
+import os
+
+from cl_diag import shared_diagnostics
+from cl_sources import live_source
+
+
+SAMPLE_INTERVAL = 1.0  # seconds between CPU samples
+MIN_INTERVAL = 0.25  # adaptive sampling bounds, in seconds
+MAX_INTERVAL = 5.0
+HISTORY_SIZE = 120  # samples kept for the live charts
+NET_STATE_PATH = os.path.join(os.path.expanduser("~"), ".cl_center", "net_totals.json")
+NET_EXCLUDE = ('lo', 'lo0', 'Loopback*', 'docker*', 'br-*', 'veth*', 'virbr*')
+COUNTER_WRAP = 2 ** 32
+BOOT_TIME_SLACK = 5.0  # seconds; boot times are derived from uptime and drift with clock adjustments
+RATE_WINDOWS = (('1s', 1.0, 10), ('1m', 60.0, 60), ('15m', 900.0, 90))  # name, seconds, buckets
+NET_WARN_STAGES = (50, 80, 95)  # percent of the limit
+
+CPU_LEVELS = {
+    1: ('above threshold', 'first'),
+    2: ('high', 'last'),
+    3: ('very high', 'end'),
+}
+
+
+def cpu_alert_text(level, cores=None, name=None):
+    wording = CPU_LEVELS[level][0]
+    if name is not None:
+        return f'Warning: CPU usage of {name} is {wording}!'
+    if cores is not None:
+        names = ', '.join(str(core) for core in cores[:4])
+        return f'Warning: CPU core {names} usage is {wording}!'
+    return f'Warning: CPU usage is {wording}!'
+
+
+def format_rate(bytes_per_second):
+    for unit, size in (('MB/s', 1048576), ('KB/s', 1024)):
+        if bytes_per_second >= size:
+            return f"{bytes_per_second / size:.1f} {unit}"
+    return f"{bytes_per_second:.0f} B/s"
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} h {int(seconds % 3600 // 60)} min"
+    return f"{seconds / 86400:.1f} days"
+
+
+def time_to_limit(usage_mb, limit_mb, bytes_per_second):
+    # Seconds until usage reaches the limit at a steady rate; None when
+    # there is no limit or nothing is moving, 0 once it is reached
+    if limit_mb is None:
+        return None
+    remaining = (limit_mb - usage_mb) * 1048576
+    if remaining <= 0:
+        return 0.0
+    if bytes_per_second <= 0:
+        return None
+    return remaining / bytes_per_second
+
+
+def net_state_path(source):
+    # Where a source's network totals are kept between runs: none for model
+    # sources, and one file per cgroup so they do not mix with the host's
+    if not source.live:
+        return None
+    key = getattr(source, 'state_key', None)
+    if key is None:
+        return NET_STATE_PATH
+    name = key.strip('/').replace('/', '_') or 'root'
+    return os.path.join(os.path.dirname(NET_STATE_PATH), f"net_totals-{name}.json")
+
+
+def ticks(interval, stop_event):
+    # Yields once per period until stop_event is set, with how many seconds
+    # late the tick is. interval is a callable so the period can change while
+    # running. Deadlines advance from the schedule, not from "now", so the
+    # period does not drift; missed ticks are skipped, not replayed.
+    next_tick = time.monotonic() + interval()
+    while not stop_event.wait(max(0.0, next_tick - time.monotonic())):
+        yield max(0.0, time.monotonic() - next_tick)
+        period = interval()
+        next_tick += period
+        now = time.monotonic()
+        if next_tick <= now:
+            next_tick = now + period - (now - next_tick) % period
+
+
+def cpu_headroom(value, thresholds):
+    # 0 at or above the nearest threshold ahead of value, 1 far below it,
+    # None when no threshold is set
+    limits = [limit for limit in thresholds if limit is not None and limit > 0]
+    if not limits:
+        return None
+    ahead = [limit for limit in limits if limit > value]
+    if not ahead:
+        return 0.0
+    nearest = min(ahead)
+    return (nearest - value) / nearest
+
+
+def net_headroom(usage_mb, limit_mb, rate_mb, horizon=600.0):
+    # Time left until the limit at the current rate (MB/s), relative to horizon
+    if limit_mb is None or limit_mb <= 0:
+        return None
+    remaining = limit_mb - usage_mb
+    if remaining <= 0:
+        return 0.0
+    if rate_mb <= 0:
+        return 1.0
+    return min(1.0, remaining / rate_mb / horizon)
+
+
+class AdaptiveInterval:
+    # Sampling period that shrinks towards min_interval as a value nears its
+    # limit and grows towards max_interval when it is far away. It speeds up
+    # at once but backs off at most 1.5x per sample, so a spike is not missed.
+    # wakeups_saved counts samples avoided compared to polling at base.
+    def __init__(self, base=SAMPLE_INTERVAL, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Need 0 < min_interval <= max_interval.")
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.current = base
+        self.wakeups_saved = 0.0
+
+    def update(self, headroom):
+        if headroom is None:
+            target = self.base
+        else:
+            target = self.min_interval + (self.max_interval - self.min_interval) * headroom
+        target = max(self.min_interval, min(self.max_interval, target))
+        self.current = target if target < self.current else min(target, self.current * 1.5)
+        self.wakeups_saved += self.current / self.base - 1
+        return self.current
+
+
+def cpu_total_time(times):
+    # guest time is already accounted in user/nice on Linux
+    return sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+
+
+def cpu_busy_percent(prev, cur):
+    # Busy share of the CPU time that elapsed between two psutil.cpu_times() snapshots
+    idle = (cur.idle - prev.idle) + (getattr(cur, 'iowait', 0) - getattr(prev, 'iowait', 0))
+    total = cpu_total_time(cur) - cpu_total_time(prev)
+    if total <= 0:
+        return 0.0
+    return round(max(0.0, min(100.0, 100.0 * (total - idle) / total)), 1)
+
+
+class RingBuffer:
+    # Fixed-capacity sample history backed by a preallocated array('d'),
+    # so memory stays constant however long the monitor runs.
+    def __init__(self, capacity=HISTORY_SIZE):
+        self.capacity = capacity
+        self.data = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        # Returns the sample that fell out of the window, if any
+        evicted = self.data[self.head] if self.count == self.capacity else None
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        return evicted
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self.data[self.head - 1]
+
+    def values(self):
+        # Oldest to newest
+        start = (self.head - self.count) % self.capacity
+        for i in range(self.count):
+            yield self.data[(start + i) % self.capacity]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+
+class WindowRate:
+    # Amount per second over the last span seconds. The window is a ring of
+    # buckets span/slots seconds wide with a running total. Each sample's
+    # amount is spread evenly over the time since the previous one, so the
+    # rate stays right however the sampling interval compares to the bucket
+    # width. begin() marks the baseline reading the first amount counts from.
+    def __init__(self, span, slots=60):
+        self.span = span
+        self.width = span / slots
+        self.buckets = array('d', bytes(8 * slots))
+        self.total = 0.0
+        self.newest = None  # absolute number of the newest bucket
+        self.started = None
+        self.last = None
+
+    def begin(self, now):
+        for index in range(len(self.buckets)):
+            self.buckets[index] = 0.0
+        self.total = 0.0
+        self.newest = int(now // self.width)
+        self.started = self.last = now
+
+    def advance(self, now):
+        bucket = int(now // self.width)
+        if bucket > self.newest:
+            slots = len(self.buckets)
+            for expired in range(self.newest + 1, min(bucket, self.newest + slots) + 1):
+                index = expired % slots
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0.0
+            self.newest = bucket
+
+    def add(self, now, amount):
+        if self.last is None:
+            self.begin(now - self.width)  # no baseline: assume one bucket's worth of time
+        start, self.last = self.last, now
+        self.advance(now)
+        slots = len(self.buckets)
+        if now <= start:
+            self.buckets[self.newest % slots] += amount
+            self.total += amount
+            return
+        per_second = amount / (now - start)
+        bucket = max(int(start // self.width), self.newest - slots + 1)
+        start = max(start, bucket * self.width)
+        while start < now:
+            end = min(now, (bucket + 1) * self.width)
+            share = per_second * (end - start)
+            self.buckets[bucket % slots] += share
+            self.total += share
+            start = end
+            bucket += 1
+
+    def rate(self, now):
+        if self.started is None:
+            return 0.0
+        self.advance(now)
+        covered = now - max(self.started, (self.newest - len(self.buckets) + 1) * self.width)
+        return max(0.0, self.total) / covered if covered > 0 else 0.0
+
+
+class NetRates:
+    # Upload and download rates over each of RATE_WINDOWS
+    def __init__(self, windows=RATE_WINDOWS):
+        self.windows = {name: (WindowRate(span, slots), WindowRate(span, slots)) for name, span, slots in windows}
+
+    def begin(self, now):
+        # Call at the baseline counter reading the first add() is measured from
+        for up, down in self.windows.values():
+            up.begin(now)
+            down.begin(now)
+
+    def add(self, now, sent, recv):
+        for up, down in self.windows.values():
+            up.add(now, sent)
+            down.add(now, recv)
+
+    def rates(self, now):
+        # {window: (up, down)} in bytes per second
+        return {name: (up.rate(now), down.rate(now)) for name, (up, down) in self.windows.items()}
+
+
+class QuotaStages:
+    # Pre-warnings at NET_WARN_STAGES percent of the limit; each stage fires
+    # once as usage crosses it, and reset() re-arms them for a new limit
+    def __init__(self, stages=NET_WARN_STAGES):
+        self.stages = stages
+        self.passed = 0
+
+    def evaluate(self, percent):
+        # Returns the highest stage newly crossed (1-based), or 0
+        passed = sum(1 for stage in self.stages if percent >= stage)
+        if passed <= self.passed:
+            return 0
+        self.passed = passed
+        return passed
+
+    def reset(self):
+        self.passed = 0
+
+
+class QuotaForecast:
+    # What both front ends make of usage against a limit: the percentage
+    # used, the time left at the 1 minute rate, and the alerts to raise, a
+    # note at each warning stage and one once the limit is exceeded
+    def __init__(self, stages=NET_WARN_STAGES):
+        self.stages = QuotaStages(stages)
+        self.exceeded = False
+        self.percent = 0.0
+        self.eta = None
+
+    def update(self, usage_mb, limit_mb, rates):
+        # Returns [(stage, level, text)] for the alerts newly due: stage is
+        # 1-based for the warning stages and 0 for the limit itself, level
+        # is the CPU_LEVELS one to raise
+        self.eta = time_to_limit(usage_mb, limit_mb, sum(rates['1m']))
+        self.percent = 100.0 * usage_mb / limit_mb if limit_mb > 0 else 100.0
+        alerts = []
+        stage = self.stages.evaluate(self.percent)
+        if stage:
+            text = f"{self.stages.stages[stage - 1]}% of the {limit_mb} MB internet limit used"
+            if self.eta:
+                text += f", about {format_duration(self.eta)} left at the current rate"
+            alerts.append((stage, stage, text))
+        if usage_mb > limit_mb and not self.exceeded:
+            self.exceeded = True
+            alerts.append((0, 3, f"Internet usage has exceeded the limit of {limit_mb} MB!"))
+        return alerts
+
+    def text(self):
+        if self.percent >= 100:
+            return "Limit reached"
+        if self.eta is None:
+            return f"{self.percent:.0f}% used, nothing moving"
+        return f"{self.percent:.0f}% used, limit in about {format_duration(self.eta)} at the current rate"
+
+    def reset(self):
+        self.stages.reset()
+        self.exceeded = False
+
+
+class SpeechAlerts:
+    # Spoken warnings are delivered by a worker thread that owns the TTS
+    # engine; the monitoring loop only ever enqueues.
+    RATE_OFFSET = {'first': -2, 'last': -2, 'end': 30}
+    MIN_REPEAT = {'first': 15.0, 'last': 10.0, 'end': 5.0}  # seconds per kind and severity
+
+    def __init__(self, max_pending=4, max_age=5.0):
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.pending = deque()
+        self.last_posted = {}  # (kind, severity) -> when
+        self.dropped = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stop_event = None
+
+    def post(self, kind, severity, text):
+        # kind is what the alert is about ('cpu', 'net', 'mem', ...), so one
+        # chatty metric cannot hold back another's warnings
+        now = time.monotonic()
+        with self.cond:
+            for alert in self.pending:
+                if alert[1] == text:
+                    alert[2] = now  # merge with the pending duplicate
+                    return False
+            if now - self.last_posted.get((kind, severity), float('-inf')) < self.MIN_REPEAT[severity]:
+                self.dropped += 1
+                return False
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append([severity, text, now])
+            self.last_posted[kind, severity] = now
+            if self.thread is None:
+                self.stop_event = threading.Event()
+                self.thread = threading.Thread(
+                    target=self.run, args=(self.stop_event,), name="speech-alerts", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return True
+
+    def run(self, stop_event):
+        import pyttsx3  # slow to import and initialise, so only done once an alert is due
+        engine = pyttsx3.init()
+        voices = engine.getProperty('voices')
+        engine.setProperty('voice', voices[0].id)
+        base_rate = engine.getProperty('rate')
+        diagnostics = shared_diagnostics()
+        speaking = diagnostics.timer('alert_speech')
+        while True:
+            with self.cond:
+                while not self.pending and not stop_event.is_set():
+                    self.cond.wait()
+                if stop_event.is_set():
+                    return
+                severity, text, posted = self.pending.popleft()
+            waited = time.monotonic() - posted
+            if waited > self.max_age:
+                self.dropped += 1  # stale, the situation has moved on
+                continue
+            diagnostics.observe('alert_wait', waited)
+            with speaking:
+                engine.setProperty('rate', base_rate + self.RATE_OFFSET[severity])
+                engine.say(text)
+                engine.runAndWait()
+
+    def stop(self):
+        with self.cond:
+            if self.stop_event is not None:
+                self.stop_event.set()
+            self.pending.clear()
+            self.thread = None
+            self.cond.notify_all()
+
+
+_speech_alerts = None
+
+
+def shared_speech_alerts():
+    # One TTS worker per process, reused by every CPU monitor window
+    global _speech_alerts
+    if _speech_alerts is None:
+        _speech_alerts = SpeechAlerts()
+    return _speech_alerts
+
+
+class CpuRules:
+    # Threshold levels 1..3 are first/last/end. Samples are smoothed with a
+    # rolling mean (window) or an EWMA (alpha) in O(1), a level is held until
+    # the value falls hysteresis points below its threshold, and end_streak
+    # counts the samples in a row held at the end level for the shutdown
+    # feature.
+    def __init__(self, window=3, alpha=None, hysteresis=5.0, shutdown_after=5):
+        self.thresholds = [None, None, None]
+        self.window = RingBuffer(window)
+        self.window_sum = 0.0
+        self.alpha = alpha
+        self.hysteresis = hysteresis
+        self.shutdown_after = shutdown_after
+        self.value = None
+        self.level = 0
+        self.end_streak = 0
+
+    def set_threshold(self, level, value):
+        self.thresholds[level - 1] = None if value is None else float(value)
+        self.level = 0  # re-arm, so a threshold change alerts again
+
+    def smooth(self, sample):
+        if self.alpha is not None:
+            if self.value is None:
+                self.value = sample
+            else:
+                self.value += self.alpha * (sample - self.value)
+        else:
+            evicted = self.window.append(sample)
+            self.window_sum += sample - (evicted or 0.0)
+            self.value = self.window_sum / len(self.window)
+        return self.value
+
+    def level_for(self, value):
+        for level in (3, 2, 1):
+            threshold = self.thresholds[level - 1]
+            if threshold is None:
+                continue
+            if level <= self.level:
+                threshold -= self.hysteresis
+            if value >= threshold:
+                return level
+        return 0
+
+    def evaluate(self, sample):
+        # Returns the level to alert at, or 0 when nothing new happened
+        level = self.level_for(self.smooth(sample))
+        rose = level > self.level
+        self.level = level
+        self.end_streak = self.end_streak + 1 if level == 3 else 0
+        return level if rose else 0
+
+    def shutdown_due(self):
+        return self.end_streak >= self.shutdown_after
+
+
+class NetAccounting:
+    # Per-interface byte totals that survive app restarts and reboots. The
+    # raw counters are diffed per interface; a counter that went backwards
+    # either wrapped at 32 bits or was reset (link down/up, reboot).
+    def __init__(self, include=None, exclude=NET_EXCLUDE, path=NET_STATE_PATH, checkpoint_every=60.0):
+        self.include = include
+        self.exclude = exclude
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.totals = {}  # nic -> [sent, recv] since accounting began
+        self.raw = {}  # nic -> [sent, recv] as last read from the OS
+        self.matched = {}
+        self.boot_time = None
+        self.count_from_zero = False
+        self.limit_mb = None
+        self.limit_base = 0
+        self.moved = (0, 0)  # (sent, recv) counted by the last update
+        self.last_save = time.monotonic()
+
+    def wanted(self, nic):
+        match = self.matched.get(nic)
+        if match is None:
+            match = ((self.include is None or any(fnmatch(nic, pattern) for pattern in self.include))
+                     and not any(fnmatch(nic, pattern) for pattern in self.exclude))
+            self.matched[nic] = match
+        return match
+
+    @staticmethod
+    def counter_delta(prev, cur):
+        if cur >= prev:
+            return cur - prev
+        if COUNTER_WRAP * 3 // 4 <= prev < COUNTER_WRAP:
+            return cur + COUNTER_WRAP - prev
+        return cur  # restarted from zero
+
+    def load(self, boot_time):
+        self.boot_time = boot_time
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.totals = state.get('totals', {})
+        self.limit_mb = state.get('limit_mb')
+        self.limit_base = state.get('limit_base', 0)
+        saved = state.get('boot_time')
+        if isinstance(saved, (int, float)) and abs(saved - boot_time) < BOOT_TIME_SLACK:
+            self.raw = state.get('raw', {})
+        # Interfaces missing from raw (e.g. after a reboot) are counted from zero
+        self.count_from_zero = True
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        state = {
+            'boot_time': self.boot_time,
+            'raw': self.raw,
+            'totals': self.totals,
+            'limit_mb': self.limit_mb,
+            'limit_base': self.limit_base,
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+        self.last_save = time.monotonic()
+
+    def update(self, counters):
+        # counters is psutil.net_io_counters(pernic=True); returns bytes moved since the last call
+        moved_sent = moved_recv = 0
+        for nic, io in counters.items():
+            if not self.wanted(nic):
+                continue
+            prev = self.raw.get(nic)
+            if prev is None:
+                prev = [0, 0] if self.count_from_zero else [io.bytes_sent, io.bytes_recv]
+            sent = self.counter_delta(prev[0], io.bytes_sent)
+            recv = self.counter_delta(prev[1], io.bytes_recv)
+            self.raw[nic] = [io.bytes_sent, io.bytes_recv]
+            total = self.totals.setdefault(nic, [0, 0])
+            total[0] += sent
+            total[1] += recv
+            moved_sent += sent
+            moved_recv += recv
+        self.moved = (moved_sent, moved_recv)
+        self.count_from_zero = True
+        if time.monotonic() - self.last_save >= self.checkpoint_every:
+            self.save()
+        return moved_sent + moved_recv
+
+    def nic_totals(self):
+        return {nic: tuple(total) for nic, total in self.totals.items() if self.wanted(nic)}
+
+    def total(self):
+        return sum(sent + recv for nic, (sent, recv) in self.totals.items() if self.wanted(nic))
+
+    def set_limit(self, limit_mb):
+        self.limit_mb = limit_mb
+        self.limit_base = self.total()
+        self.save()
+
+    def usage_mb(self):
+        return (self.total() - self.limit_base) / (1024 * 1024)
+
+
+def have_numpy():
+    # Per-core readings need numpy; everything else runs without it
+    return importlib.util.find_spec('numpy') is not None
+
+
+class CoreLoad:
+    # Per-core busy percentages from psutil.cpu_times(percpu=True), computed
+    # as a few vector operations on a cores x fields array so the cost per
+    # tick stays flat as the core count grows.
+    def __init__(self):
+        import numpy as np
+        self.np = np
+        self.prev = None
+        self.weights = None
+        self.idle_cols = None
+
+    def update(self, times):
+        np = self.np
+        cur = np.array(times, dtype=np.float64)
+        if self.prev is None or self.prev.shape != cur.shape:
+            fields = times[0]._fields
+            self.weights = np.array([0.0 if f in ('guest', 'guest_nice') else 1.0 for f in fields])
+            self.idle_cols = [fields.index(f) for f in ('idle', 'iowait') if f in fields]
+            self.prev = cur
+            return None
+        delta = cur - self.prev
+        self.prev = cur
+        total = delta @ self.weights
+        busy = total - delta[:, self.idle_cols].sum(axis=1)
+        percents = np.clip(100.0 * busy / np.where(total > 0, total, 1.0), 0.0, 100.0)
+        overall = 100.0 * busy.sum() / total.sum() if total.sum() > 0 else 0.0
+        return round(float(overall), 1), percents.round(1)
+
+
+class CoreThresholds:
+    # first/last/end thresholds checked against every core at once; levels
+    # holds the alert state per core so each core alerts once per breach.
+    def __init__(self):
+        import numpy as np
+        self.np = np
+        self.limits = np.full(3, np.inf)
+        self.level_of = np.arange(1, 4)
+        self.levels = None
+
+    def set_limit(self, level, value):
+        self.limits[level - 1] = self.np.inf if value is None else float(value)
+
+    def evaluate(self, percents):
+        np = self.np
+        levels = ((percents[:, None] >= self.limits) * self.level_of).max(axis=1)
+        if self.levels is None or self.levels.shape != levels.shape:
+            self.levels = np.zeros_like(levels)
+        rising = levels > self.levels
+        self.levels = levels
+        if not rising.any():
+            return 0, rising.nonzero()[0]
+        top = int(levels[rising].max())
+        return top, np.flatnonzero(rising & (levels == top))
+
+
+class CpuReader:
+    # Delta-based CPU readings; the first call only takes the baseline
+    def __init__(self, source=None):
+        self.source = source
+        self.prev = None
+        self.core_load = None
+
+    def read(self, percpu=False):
+        # Returns (total, per-core percents or None); total is None while priming
+        if self.source is None:
+            self.source = live_source()
+        if percpu:
+            self.prev = None  # a later total starts from a fresh baseline, not one from before per-core mode
+            if self.core_load is None:
+                self.core_load = CoreLoad()
+            result = self.core_load.update(self.source.cpu_times(percpu=True))
+            return result if result is not None else (None, None)
+        self.core_load = None
+        cur = self.source.cpu_times()
+        prev, self.prev = self.prev, cur
+        if prev is None:
+            return None, None
+        return cpu_busy_percent(prev, cur), None
+
+
+class CpuSampler:
+    # Background thread that reads the CPU once per interval and hands the
+    # results to on_sample(total) and on_cores(percents), or both at once to
+    # on_reading(total, percents or None)
+    def __init__(self, interval=SAMPLE_INTERVAL, on_sample=None, on_cores=None, adaptive=None, source=None,
+                 on_reading=None):
+        self.interval = interval
+        self.source = source
+        self.on_sample = on_sample
+        self.on_cores = on_cores
+        self.on_reading = on_reading
+        self.adaptive = adaptive
+        self.thresholds = (None, None, None)
+        self.percpu = False
+        self.processes = None  # a cl_procs.ProcessTop, scanned before each sample is handed on
+        self.thread = None
+        self.stop_event = None
+
+    def set_interval(self, interval):
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive.")
+        self.interval = interval
+        if self.adaptive is not None:
+            self.adaptive.base = interval
+
+    def next_interval(self):
+        return self.interval if self.adaptive is None else self.adaptive.current
+
+    def start(self):
+        if self.thread is not None:
+            return
+        if self.source is None:
+            self.source = live_source()  # kept across restarts, so its files are opened once
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(self.stop_event,), name="cpu-sampler", daemon=True)
+        self.thread.start()
+
+    def run(self, stop_event):
+        diagnostics = shared_diagnostics()
+        reading = diagnostics.timer('cpu_read')
+        scanning = diagnostics.timer('process_scan')
+        lag = diagnostics.histogram('sampler_lag')
+        reader = CpuReader(self.source)
+        reader.read(self.percpu)
+        for late in ticks(self.next_interval, stop_event):
+            lag.observe(late)
+            with reading:
+                total, cores = reader.read(self.percpu)
+            if total is None:
+                continue
+            if self.adaptive is not None:
+                peak = total if cores is None else max(total, float(cores.max()))
+                self.adaptive.update(cpu_headroom(peak, self.thresholds))
+            processes = self.processes
+            if processes is not None:
+                with scanning:
+                    processes.scan()
+            if self.on_sample is not None:
+                self.on_sample(total)
+            if cores is not None and self.on_cores is not None:
+                self.on_cores(cores)
+            if self.on_reading is not None:
+                self.on_reading(total, cores)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
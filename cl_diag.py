@@ -0,0 +1,106 @@
+# Self-instrumentation: how long CL Center's own sampling, rules, UI updates
+# and alerts take, and how late ticks fire. Kept in fixed-bucket histograms,
+# so recording costs a bisect and an increment and memory never grows.
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+# Bucket upper bounds in seconds, as in Prometheus histograms
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = array('Q', bytes(8 * (len(bounds) + 1)))  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        # Called from one thread per histogram, so no lock is taken
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation, capped at max
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        running = 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            if running >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        # (upper bound, observations at or below it) pairs, ending with +Inf
+        running = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            running += count
+            yield bound, running
+
+
+class Timer:
+    # Reusable with-block timer for one stage; create it once and keep it,
+    # and use it from one thread at a time
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Diagnostics:
+    def __init__(self):
+        self.histograms = {}
+        self.started = time.monotonic()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def timer(self, name):
+        return Timer(self.histogram(name))
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def report(self):
+        lines = [f"up {time.monotonic() - self.started:.0f} s; times in ms, percentiles are bucket bounds",
+                 f"{'stage':18} {'count':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"]
+        for name, histogram in sorted(self.histograms.items()):
+            if not histogram.count:
+                continue
+            figures = (histogram.total / histogram.count, histogram.quantile(0.5), histogram.quantile(0.95),
+                       histogram.quantile(0.99), histogram.max)
+            lines.append(f"{name:18} {histogram.count:>8} " + ' '.join(f"{value * 1000:>8.3f}" for value in figures))
+        return '\n'.join(lines)
+
+    def dump(self, file=None):
+        print(self.report(), file=file or sys.stderr, flush=True)
+
+
+_diagnostics = None
+
+
+def shared_diagnostics():
+    # One set of histograms per process, filled by every monitor and thread
+    global _diagnostics
+    if _diagnostics is None:
+        _diagnostics = Diagnostics()
+    return _diagnostics
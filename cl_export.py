@@ -0,0 +1,232 @@
+# Export of the --history database to CSV or Parquet for capacity planning.
+# Rows are streamed from SQLite a chunk at a time and written as they come,
+# so memory stays flat however large the history is. ExportJob runs the same
+# export on a background thread for the window.
+import argparse
+import bz2
+import csv
+import gzip
+import lzma
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from cl_store import HISTORY_PATH
+
+CHUNK_ROWS = 10000
+COMPRESSORS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+PARQUET_CODECS = ('snappy', 'zstd', 'gzip', 'none')
+SAMPLE_COLUMNS = {
+    'raw': ('ts', 'metric', 'value'),
+    '1m': ('ts', 'metric', 'value', 'low', 'high', 'count'),
+    '1h': ('ts', 'metric', 'value', 'low', 'high', 'count'),
+}
+EVENT_COLUMNS = ('ts', 'kind', 'severity', 'text')
+
+
+def parse_time(text, now=None):
+    # Seconds since the epoch, an ISO date/time, or an age such as 90m, 12h or 7d
+    now = time.time() if now is None else now
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text[-1:] in units:
+        try:
+            return now - float(text[:-1]) * units[text[-1]]
+        except ValueError:
+            pass
+    return datetime.fromisoformat(text).timestamp()
+
+
+def sample_rows(db, start, end, metrics=None, resolution='raw'):
+    # Metric by metric along the (metric, ts) index, so nothing is sorted in memory
+    ids = db.execute("SELECT name, id FROM metrics ORDER BY name").fetchall()
+    if metrics:
+        ids = [(name, metric) for name, metric in ids if name in metrics]
+    if resolution == 'raw':
+        sql = "SELECT ts, ?, value FROM samples WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts"
+    else:
+        sql = (f"SELECT bucket, ?, total / count, low, high, count FROM samples_{resolution} "
+               f"WHERE metric = ? AND bucket >= ? AND bucket < ? ORDER BY bucket")
+    for name, metric in ids:
+        cursor = db.execute(sql, (name, metric, start, end))
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            yield rows
+
+
+def event_rows(db, start, end, kinds=None):
+    sql = "SELECT ts, kind, severity, text FROM events WHERE ts >= ? AND ts < ?"
+    if kinds:
+        sql += f" AND kind IN ({', '.join('?' * len(kinds))})"
+    cursor = db.execute(sql + " ORDER BY ts", (start, end, *(kinds or ())))
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            return
+        yield rows
+
+
+class CsvWriter:
+    def __init__(self, path, columns, compress=None):
+        opener = COMPRESSORS[compress] if compress else open
+        self.file = opener(path, 'wt', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    # One row group per chunk; needs pyarrow
+    def __init__(self, path, columns, compress=None):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        types = {'ts': pyarrow.float64(), 'value': pyarrow.float64(), 'low': pyarrow.float64(),
+                 'high': pyarrow.float64(), 'count': pyarrow.int64()}
+        self.schema = pyarrow.schema([(column, types.get(column, pyarrow.string())) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression=compress or 'snappy')
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def export(output, history=HISTORY_PATH, events=False, start=0.0, end=None, metrics=None, kinds=None,
+           resolution='raw', fmt=None, compress=None, progress=None, cancel=None):
+    # Writes samples (or alert events) between start and end to output and
+    # returns the number of rows. The file only appears once complete; a
+    # cancelled export (cancel is a threading.Event) leaves nothing behind.
+    end = time.time() + 1 if end is None else end
+    fmt = fmt or ('parquet' if output.endswith('.parquet') else 'csv')
+    if fmt == 'csv' and compress is None:
+        compress = EXTENSIONS.get(os.path.splitext(output)[1])
+    if fmt == 'csv' and compress not in (None, *COMPRESSORS):
+        raise ValueError(f"CSV compression is one of {', '.join(COMPRESSORS)}")
+    if fmt == 'parquet' and compress not in (None, *PARQUET_CODECS):
+        raise ValueError(f"Parquet compression is one of {', '.join(PARQUET_CODECS)}")
+    if resolution not in SAMPLE_COLUMNS:
+        raise ValueError(f"resolution is one of {', '.join(SAMPLE_COLUMNS)}")
+    db = sqlite3.connect(f'file:{os.path.abspath(history)}?mode=ro', uri=True)
+    partial = output + '.part'
+    written = 0
+    try:
+        columns = EVENT_COLUMNS if events else SAMPLE_COLUMNS[resolution]
+        writer = (ParquetWriter if fmt == 'parquet' else CsvWriter)(partial, columns, compress)
+        try:
+            chunks = event_rows(db, start, end, kinds) if events else sample_rows(db, start, end, metrics, resolution)
+            for rows in chunks:
+                if cancel is not None and cancel.is_set():
+                    break
+                writer.write(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress(written)
+        finally:
+            writer.close()
+        if cancel is not None and cancel.is_set():
+            os.remove(partial)
+        else:
+            os.replace(partial, output)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        db.close()
+    return written
+
+
+class ExportJob:
+    # export() on a background thread. rows counts what has been written so
+    # far; error holds the exception if it failed. on_done(job) is called
+    # from the export thread.
+    def __init__(self, output, on_done=None, **options):
+        self.output = output
+        self.options = options
+        self.on_done = on_done
+        self.rows = 0
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def progress(self, rows):
+        self.rows = rows
+
+    def run(self):
+        try:
+            self.rows = export(self.output, progress=self.progress, cancel=self.cancel_event, **self.options)
+        except Exception as exc:  # sqlite3.Error, OSError, ValueError, a missing pyarrow
+            self.error = exc
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="history-export", daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cl_export", description="Export CL Center history to CSV or Parquet.")
+    parser.add_argument('output', help="file to write; .parquet selects Parquet, .csv.gz/.bz2/.xz compress CSV")
+    parser.add_argument('--history', default=HISTORY_PATH, help="history database (default: %(default)s)")
+    parser.add_argument('--events', action='store_true', help="export alert events instead of samples")
+    parser.add_argument('--metric', nargs='+', help="only these metrics, e.g. cpu net_bytes mem")
+    parser.add_argument('--kind', nargs='+', help="only events of these kinds, e.g. cpu net action")
+    parser.add_argument('--since', default='0', help="start: epoch seconds, ISO date/time or an age like 7d")
+    parser.add_argument('--until', help="end, in the same forms (default: now)")
+    parser.add_argument('--resolution', choices=tuple(SAMPLE_COLUMNS), default='raw',
+                        help="raw samples or the 1 minute / 1 hour rollups with low, high and count")
+    parser.add_argument('--format', choices=('csv', 'parquet'), help="default: from the file name")
+    parser.add_argument('--compress', help="gzip, bz2 or xz for CSV; snappy, zstd, gzip or none for Parquet")
+    args = parser.parse_args(argv)
+    try:
+        start = parse_time(args.since)
+        end = parse_time(args.until) if args.until else None
+    except ValueError as exc:
+        parser.error(f"bad time: {exc}")
+    if not os.path.exists(args.history):
+        parser.error(f"no history database at {args.history}; record one with --history")
+    began = time.perf_counter()
+    try:
+        rows = export(args.output, args.history, args.events, start, end, args.metric, args.kind,
+                      args.resolution, args.format, args.compress)
+    except ImportError:
+        parser.error("Parquet export needs pyarrow (pip install pyarrow)")
+    except (ValueError, sqlite3.Error) as exc:
+        parser.error(str(exc))
+    print(f"{rows} rows written to {args.output} in {time.perf_counter() - began:.1f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
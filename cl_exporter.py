@@ -0,0 +1,162 @@
+# Optional Prometheus/OpenMetrics endpoint. Monitors publish their latest
+# figures into a MetricsSnapshot once per tick; scrapes are answered from
+# the cached rendering and never take samples of their own.
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = 9464
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+EXTRA_GAUGES = {
+    'mem': ('cl_center_memory_used_percent', 'Memory in use, not counting reclaimable cache.'),
+    'swap': ('cl_center_swap_used_percent', 'Swap in use.'),
+    'disk_read': ('cl_center_disk_read_megabytes_per_second', 'Read throughput over all disks.'),
+    'disk_write': ('cl_center_disk_write_megabytes_per_second', 'Write throughput over all disks.'),
+    'load': ('cl_center_load_average', 'One minute load average.'),
+    'temp': ('cl_center_temperature_celsius', 'Hottest temperature sensor.'),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsSnapshot:
+    def __init__(self, diagnostics=None):
+        self.diagnostics = diagnostics  # a cl_diag.Diagnostics, exported as histograms
+        self.lock = threading.Lock()
+        self.values = {}
+        self.alerts = {}
+        self.rendered = None
+
+    def update(self, **values):
+        with self.lock:
+            self.values.update(values)
+            self.values['timestamp'] = time.time()
+            self.rendered = None
+
+    def count_alert(self, kind, severity):
+        with self.lock:
+            key = (kind, severity)
+            self.alerts[key] = self.alerts.get(key, 0) + 1
+            self.rendered = None
+
+    def render(self):
+        # Rendered at most once per update, however many scrapers there are
+        with self.lock:
+            if self.rendered is None:
+                self.rendered = '\n'.join(self.lines()).encode() + b'\n'
+            return self.rendered
+
+    def lines(self):
+        values = self.values
+
+        def metric(name, kind, help_text, samples):
+            yield f'# HELP {name} {help_text}'
+            yield f'# TYPE {name} {kind}'
+            for labels, value in samples:
+                yield f'{name}{labels} {value}'
+
+        if values.get('cpu') is not None:
+            yield from metric('cl_center_cpu_usage_percent', 'gauge', 'Total CPU usage.',
+                              [('', values['cpu'])])
+        if values.get('cores') is not None:
+            yield from metric('cl_center_cpu_core_usage_percent', 'gauge', 'CPU usage per core.',
+                              [(f'{{core="{core}"}}', value) for core, value in enumerate(values['cores'])])
+        if values.get('cgroups'):
+            yield from metric('cl_center_cgroup_cpu_usage_percent', 'gauge',
+                              'CPU usage per cgroup, relative to its quota.',
+                              [(f'{{cgroup="{escape_label(path)}"}}', value)
+                               for path, value in sorted(values['cgroups'].items())])
+        if 'net_totals' in values:
+            totals = sorted(values['net_totals'].items())
+            yield from metric('cl_center_network_sent_bytes_total', 'counter', 'Bytes sent per interface.',
+                              [(f'{{interface="{escape_label(nic)}"}}', sent) for nic, (sent, recv) in totals])
+            yield from metric('cl_center_network_received_bytes_total', 'counter',
+                              'Bytes received per interface.',
+                              [(f'{{interface="{escape_label(nic)}"}}', recv) for nic, (sent, recv) in totals])
+        if values.get('net_rates'):
+            yield from metric('cl_center_network_rate_bytes_per_second', 'gauge',
+                              'Upload and download rate over each averaging window.',
+                              [(f'{{window="{window}",direction="{direction}"}}', round(rate, 1))
+                               for window, pair in values['net_rates'].items()
+                               for direction, rate in zip(('up', 'down'), pair)])
+        if values.get('limit_eta') is not None:
+            yield from metric('cl_center_network_limit_eta_seconds', 'gauge',
+                              'Time until the limit is reached at the 1 minute rate.',
+                              [('', round(values['limit_eta'], 1))])
+        if values.get('net_mb') is not None:
+            yield from metric('cl_center_network_usage_megabytes', 'gauge', 'Usage since the limit was set.',
+                              [('', values['net_mb'])])
+        if values.get('limit_mb') is not None:
+            yield from metric('cl_center_network_limit_megabytes', 'gauge', 'Internet usage limit.',
+                              [('', values['limit_mb'])])
+            yield from metric('cl_center_network_limit_ratio', 'gauge', 'Usage as a fraction of the limit.',
+                              [('', round((values.get('net_mb') or 0) / values['limit_mb'], 4)
+                                if values['limit_mb'] else 0)])
+        extras = values.get('extras') or {}
+        for name, (metric_name, help_text) in EXTRA_GAUGES.items():
+            if extras.get(name) is not None:
+                yield from metric(metric_name, 'gauge', help_text, [('', extras[name])])
+        if extras.get('disks'):
+            yield from metric('cl_center_disk_throughput_megabytes_per_second', 'gauge',
+                              'Read and write throughput per disk.',
+                              [(f'{{disk="{escape_label(disk)}",direction="{direction}"}}', rate)
+                               for disk, pair in sorted(extras['disks'].items())
+                               for direction, rate in zip(('read', 'write'), pair)])
+        yield from metric('cl_center_alerts_total', 'counter', 'Alerts raised by kind and severity.',
+                          [(f'{{kind="{kind}",severity="{severity}"}}', count)
+                           for (kind, severity), count in sorted(self.alerts.items())])
+        if values.get('wakeups_saved'):
+            yield from metric('cl_center_wakeups_saved_total', 'counter',
+                              'Samples skipped by adaptive scheduling compared to the base interval.',
+                              [(f'{{monitor="{name}"}}', max(0, count))
+                               for name, count in sorted(values['wakeups_saved'].items())])
+        if self.diagnostics is not None:
+            yield from self.histogram_lines()
+        if 'timestamp' in values:
+            yield from metric('cl_center_snapshot_timestamp_seconds', 'gauge', 'When the snapshot was taken.',
+                              [('', round(values['timestamp'], 3))])
+
+    def histogram_lines(self):
+        name = 'cl_center_stage_seconds'
+        yield f'# HELP {name} Time CL Center itself spends per stage, and how late its ticks fire.'
+        yield f'# TYPE {name} histogram'
+        for stage, histogram in sorted(self.diagnostics.histograms.items()):
+            stage = escape_label(stage)
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}'
+            yield f'{name}_sum{{stage="{stage}"}} {histogram.total}'
+            yield f'{name}_count{{stage="{stage}"}} {histogram.count}'
+
+
+class MetricsExporter:
+    def __init__(self, snapshot, host='127.0.0.1', port=METRICS_PORT):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = snapshot.render()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.snapshot = snapshot
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-exporter", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,431 @@
+# Fleet mode: headless monitors on many machines push their samples to one
+# collector, which keeps each host's latest reading and reports fleet-wide
+# percentiles and the top offenders. Agents batch samples into
+# length-prefixed JSON frames over TCP or a Unix socket and reconnect with
+# backoff; while the collector is slow or away they keep a bounded queue and
+# drop the oldest samples. Run the collector with
+# `python cl_fleet.py collect --listen 0.0.0.0:9470` and each agent with
+# `python cl_headless.py --fleet HOST:9470`, or everything on loopback with
+# `python cl_fleet.py loopback --agents 200`.
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+from cl_diag import shared_diagnostics
+
+FLEET_PORT = 9470
+FRAME = struct.Struct('>I')  # payload length in front of every JSON frame
+MAX_FRAME = 4 << 20
+BATCH_SIZE = 64  # samples per frame at most
+FLUSH_EVERY = 1.0  # seconds a sample may wait for a full batch
+QUEUE_SIZE = 3600  # samples kept while disconnected, an hour at 1 Hz
+STALE_AFTER = 10.0  # seconds without a sample before a host stops counting
+FORGET_AFTER = 3600.0
+REPORT_EVERY = 5.0
+TOP_HOSTS = 5
+
+
+def parse_address(text):
+    # "unix:/path" -> "/path"; "host:port" or ":port" -> (host, port)
+    if text.startswith('unix:'):
+        return text[5:]
+    host, colon, port = text.rpartition(':')
+    if not colon or not port.isdigit():
+        raise ValueError(f"expected HOST:PORT or unix:PATH, not {text!r}")
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+async def open_connection(address):
+    if isinstance(address, str):
+        return await asyncio.open_unix_connection(address)
+    return await asyncio.open_connection(*address)
+
+
+async def start_server(handler, address):
+    if isinstance(address, str):
+        return await asyncio.start_unix_server(handler, address)
+    return await asyncio.start_server(handler, *address, reuse_address=True)
+
+
+def encode_frame(message):
+    payload = json.dumps(message, separators=(',', ':')).encode()
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if size > MAX_FRAME:
+        raise ValueError(f"frame of {size} bytes is too large")
+    return json.loads(await reader.readexactly(size))
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def clean_sample(sample):
+    # The parts of an agent's sample the summary uses, or None if any of
+    # them is malformed. Each part may be missing.
+    if not isinstance(sample, dict):
+        return None
+    clean = {}
+    if 'cpu' in sample:
+        if not is_number(sample['cpu']):
+            return None
+        clean['cpu'] = sample['cpu']
+    if 'rates' in sample:
+        rates = sample['rates']
+        if not isinstance(rates, dict):
+            return None
+        if '1m' in rates:
+            minute = rates['1m']
+            if not (isinstance(minute, list) and len(minute) == 2 and all(map(is_number, minute))):
+                return None
+            clean['rates'] = {'1m': minute}
+    alerts = sample.get('alerts', [])
+    if not isinstance(alerts, list):
+        return None
+    clean['alerts'] = len(alerts)
+    return clean
+
+
+def nearest_rank(ordered, q):
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class FleetAgent:
+    # Ships samples to a collector. send() may be called from any thread; the
+    # connection lives on the agent's own event loop, started with start().
+    # run() can also be awaited on an existing loop, feeding it with enqueue().
+    def __init__(self, address, name=None, batch_size=BATCH_SIZE, flush_every=FLUSH_EVERY, queue_size=QUEUE_SIZE):
+        self.address = address
+        self.name = name or socket.gethostname()
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.pending = deque(maxlen=queue_size)
+        self.dropped = 0  # samples pushed out of a full queue
+        self.sent = 0
+        self.connected = False
+        self.loop = None
+        self.thread = None
+        self.ready = None
+        self.stopping = None
+        self.closing = False
+        self.time_send = shared_diagnostics().timer('fleet_send')
+
+    def enqueue(self, record):
+        # On the agent's loop only
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size and self.ready is not None:
+            self.ready.set()
+
+    def send(self, record):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.enqueue, record)
+
+    def requeue(self, batch):
+        # Put an unsent batch back in front; a full queue loses its oldest samples
+        items = batch + list(self.pending)
+        self.dropped += max(0, len(items) - self.pending.maxlen)
+        self.pending.clear()
+        self.pending.extend(items)
+
+    async def flush(self, writer):
+        while self.pending:
+            batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+            try:
+                with self.time_send:
+                    writer.write(encode_frame({'dropped': self.dropped, 'samples': batch}))
+                    await writer.drain()  # waits while the collector is not keeping up
+            except BaseException:
+                self.requeue(batch)
+                raise
+            self.sent += len(batch)
+
+    async def run(self):
+        self.ready = asyncio.Event()
+        self.stopping = asyncio.Event()
+        if self.closing:
+            self.stopping.set()
+        delay = 0.5
+        while not self.stopping.is_set():
+            try:
+                reader, writer = await open_connection(self.address)
+            except OSError:
+                await self.pause(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            self.connected = True
+            delay = 0.5
+            try:
+                writer.write(encode_frame({'hello': self.name, 'version': 1}))
+                while True:
+                    await self.flush(writer)
+                    if self.stopping.is_set():
+                        break
+                    await self.pause(self.flush_every)
+                    self.ready.clear()
+            except (OSError, ConnectionError):
+                pass
+            finally:
+                self.connected = False
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (OSError, ConnectionError):
+                    pass
+
+    async def pause(self, seconds):
+        # Sleep until the timeout, a full batch or stop(), whichever is first
+        waits = [asyncio.ensure_future(self.ready.wait()), asyncio.ensure_future(self.stopping.wait())]
+        await asyncio.wait(waits, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        for wait in waits:
+            wait.cancel()
+
+    def close_soon(self):
+        self.closing = True
+        if self.stopping is not None:
+            self.stopping.set()
+
+    def run_thread(self):
+        try:
+            self.loop.run_until_complete(self.run())
+        finally:
+            self.loop.close()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run_thread, name='fleet-agent', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        # Last samples go out if the collector is reachable within timeout
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.close_soon)
+        self.thread.join(timeout)
+        self.thread = None
+
+
+class HostState:
+    __slots__ = ('latest', 'seen', 'samples', 'alerts', 'dropped', 'connected')
+
+    def __init__(self):
+        self.latest = None
+        self.seen = 0.0
+        self.samples = 0
+        self.alerts = 0  # since the last report
+        self.dropped = 0
+        self.connected = False
+
+
+class FleetCollector:
+    # Latest sample per host, and a summary across hosts that have reported
+    # within stale_after seconds. Hosts silent for forget_after are removed.
+    def __init__(self, stale_after=STALE_AFTER, forget_after=FORGET_AFTER, top=TOP_HOSTS):
+        self.stale_after = stale_after
+        self.forget_after = forget_after
+        self.top = top
+        self.hosts = {}
+        self.connections = {}  # handler task -> writer
+        self.samples = 0
+        self.batches = 0
+        self.rejected = 0  # malformed messages and samples, dropped on arrival
+        self.time_ingest = shared_diagnostics().timer('fleet_ingest')
+
+    def ingest(self, name, message):
+        with self.time_ingest:
+            samples = message.get('samples') if isinstance(message, dict) else None
+            if not isinstance(samples, list):
+                self.rejected += 1
+                return
+            cleaned = [clean for clean in map(clean_sample, samples) if clean is not None]
+            self.rejected += len(samples) - len(cleaned)
+            host = self.hosts.get(name)
+            if host is None:
+                host = self.hosts[name] = HostState()
+            if cleaned:
+                host.latest = cleaned[-1]
+            host.seen = time.monotonic()
+            host.samples += len(cleaned)
+            host.alerts += sum(clean['alerts'] for clean in cleaned)
+            if isinstance(message.get('dropped'), int) and not isinstance(message['dropped'], bool):
+                host.dropped = message['dropped']
+            self.samples += len(cleaned)
+            self.batches += 1
+
+    async def handle(self, reader, writer):
+        name = None
+        self.connections[asyncio.current_task()] = writer
+        try:
+            hello = await read_frame(reader)
+            name = str(hello['hello'])
+            self.hosts.setdefault(name, HostState()).connected = True
+            while True:
+                self.ingest(name, await read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError, KeyError, TypeError):
+            pass  # the agent went away or sent garbage; it reconnects by itself
+        finally:
+            if name in self.hosts:
+                self.hosts[name].connected = False
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+    def summary(self):
+        now = time.monotonic()
+        for name in [name for name, host in self.hosts.items()
+                     if not host.connected and now - host.seen > self.forget_after]:
+            del self.hosts[name]
+        fresh = {name: host.latest for name, host in self.hosts.items()
+                 if host.latest is not None and now - host.seen <= self.stale_after}
+        report = {'ts': round(time.time(), 3), 'hosts': len(fresh), 'stale': len(self.hosts) - len(fresh),
+                  'samples': self.samples, 'batches': self.batches, 'rejected': self.rejected,
+                  'alerts': sum(host.alerts for host in self.hosts.values()),
+                  'dropped': sum(host.dropped for host in self.hosts.values())}
+        for host in self.hosts.values():
+            host.alerts = 0
+        cpus = sorted((latest['cpu'], name) for name, latest in fresh.items() if 'cpu' in latest)
+        if cpus:
+            values = [cpu for cpu, name in cpus]
+            report['cpu'] = {'p50': nearest_rank(values, 0.5), 'p95': nearest_rank(values, 0.95),
+                             'p99': nearest_rank(values, 0.99), 'max': values[-1]}
+            report['top_cpu'] = [[name, cpu] for cpu, name in reversed(cpus[-self.top:])]
+        rates = sorted((sum(latest['rates']['1m']), name) for name, latest in fresh.items() if 'rates' in latest)
+        if rates:
+            report['top_net'] = [[name, round(rate)] for rate, name in reversed(rates[-self.top:])]
+        return report
+
+    async def report(self, out, report_every, stop):
+        # One summary line every report_every seconds, and a last one on stop
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), report_every)
+            except asyncio.TimeoutError:
+                pass
+            out.write(json.dumps(self.summary(), separators=(',', ':')) + '\n')
+            out.flush()
+
+    async def serve(self, address, out, report_every=REPORT_EVERY, stop=None):
+        server = await start_server(self.handle, address)
+        try:
+            await self.report(out, report_every, stop or asyncio.Event())
+        finally:
+            server.close()
+            for writer in self.connections.values():
+                writer.close()  # each handler then sees the end of its stream and returns
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await server.wait_closed()
+            if isinstance(address, str):
+                os.unlink(address)
+
+
+def synthetic_samples(seed, cores=4):
+    # Stand-in for a headless monitor: one record per call, one second apart
+    from cl_core import CpuReader, NetRates
+    from cl_sources import SyntheticSource
+    source = SyntheticSource(cores=cores, seed=seed)
+    cpu = CpuReader(source)
+    rates = NetRates()
+    source.step(1.0)
+    cpu.read()
+    rates.begin(source.time())
+    while True:
+        received = source.received
+        source.step(1.0)
+        total, _ = cpu.read()
+        now = source.time()
+        rates.add(now, 0, source.received - received)
+        record = {'ts': round(now, 3), 'cpu': total,
+                  'rates': {window: [round(up), round(down)] for window, (up, down) in rates.rates(now).items()}}
+        if total > 90:
+            record['alerts'] = [{'kind': 'cpu', 'severity': 'end', 'text': 'CPU usage is very high!'}]
+        yield record
+
+
+async def loopback(agents, seconds, rate, report_every, out):
+    # A collector and many agents in one event loop over 127.0.0.1
+    collector = FleetCollector()
+    stop = asyncio.Event()
+    server = await start_server(collector.handle, ('127.0.0.1', 0))
+    address = server.sockets[0].getsockname()[:2]
+    fleet = [FleetAgent(address, f'agent-{n:04d}') for n in range(agents)]
+    tasks = [asyncio.ensure_future(agent.run()) for agent in fleet]
+
+    async def produce(agent, samples):
+        while not stop.is_set():
+            agent.enqueue(next(samples))
+            await asyncio.sleep(1 / rate)
+
+    producers = [asyncio.ensure_future(produce(agent, synthetic_samples(n))) for n, agent in enumerate(fleet)]
+    reporter = asyncio.ensure_future(collector.report(out, report_every, stop))
+    await asyncio.sleep(seconds)
+    stop.set()
+    for agent in fleet:
+        agent.close_soon()
+    await asyncio.gather(*producers, reporter, *tasks)
+    server.close()
+    await server.wait_closed()
+    sent = sum(agent.sent for agent in fleet)
+    print(f"{agents} agents sent {sent} samples, collector received {collector.samples} "
+          f"in {collector.batches} batches, {sum(agent.dropped for agent in fleet)} dropped", file=sys.stderr)
+    shared_diagnostics().dump()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cl_fleet", description="Aggregate CL Center monitors across hosts.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    collect = commands.add_parser('collect', help="receive samples from agents and print fleet summaries")
+    collect.add_argument('--listen', default=f'0.0.0.0:{FLEET_PORT}', help="HOST:PORT or unix:PATH")
+    collect.add_argument('--every', type=float, default=REPORT_EVERY, help="seconds between summaries")
+    collect.add_argument('--stale', type=float, default=STALE_AFTER,
+                         help="seconds without a sample before a host is left out")
+    collect.add_argument('--top', type=int, default=TOP_HOSTS, help="offenders listed per summary")
+    collect.add_argument('--output', '-o', help="append JSON lines to this file instead of stdout")
+    test = commands.add_parser('loopback', help="run a collector and simulated agents on 127.0.0.1")
+    test.add_argument('--agents', type=int, default=100)
+    test.add_argument('--seconds', type=float, default=10.0)
+    test.add_argument('--rate', type=float, default=1.0, help="samples per second per agent")
+    test.add_argument('--every', type=float, default=REPORT_EVERY, help="seconds between summaries")
+    args = parser.parse_args(argv)
+    if args.every <= 0:
+        parser.error("--every must be positive")
+
+    if args.command == 'loopback':
+        if args.agents <= 0 or args.rate <= 0:
+            parser.error("--agents and --rate must be positive")
+        asyncio.run(loopback(args.agents, args.seconds, args.rate, args.every, sys.stdout))
+        return 0
+
+    try:
+        address = parse_address(args.listen)
+    except ValueError as exc:
+        parser.error(str(exc))
+    out = open(args.output, 'a') if args.output else sys.stdout
+
+    async def collect_until_signal():
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+        await FleetCollector(args.stale, top=args.top).serve(address, out, args.every, stop)
+
+    try:
+        asyncio.run(collect_until_signal())
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,392 @@
+# Headless CPU and internet monitor for servers: samples on a fixed cadence
+# and writes one JSON object per line. Run it directly or with
+# `python "CL Center.py" --headless [options]`.
+import argparse
+import json
+import signal
+import sys
+import threading
+
+from cl_core import (
+    SAMPLE_INTERVAL, MIN_INTERVAL, MAX_INTERVAL, NET_EXCLUDE, NET_STATE_PATH, CPU_LEVELS, AdaptiveInterval,
+    CpuReader, CpuRules, CoreThresholds, NetAccounting, NetRates, QuotaForecast, cpu_alert_text,
+    cpu_headroom, have_numpy, net_headroom, net_state_path, shared_speech_alerts, ticks
+)
+from cl_diag import shared_diagnostics
+from cl_procs import top_records, top_text
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="cl_headless", description="CL Center monitor without a GUI.")
+    parser.add_argument('--interval', type=float, default=SAMPLE_INTERVAL, help="seconds between samples")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="sample faster near the thresholds/limit and slower when far from them")
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help="adaptive lower bound in seconds")
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help="adaptive upper bound in seconds")
+    parser.add_argument('--first', type=float, help="first error threshold in %%")
+    parser.add_argument('--last', type=float, help="last error threshold in %%")
+    parser.add_argument('--end', type=float, help="end error threshold in %%")
+    parser.add_argument('--percpu', action='store_true', help="also check the thresholds per core")
+    parser.add_argument('--top', type=int, metavar='N',
+                        help="attach the N processes using the most CPU to each CPU alert (live readings only)")
+    parser.add_argument('--limit', type=float, help="internet usage limit in MB")
+    parser.add_argument('--extra', action='store_true',
+                        help="also read memory, swap, disk throughput, load average and temperature "
+                             "(live readings only)")
+    parser.add_argument('--metric-limit', action='append', default=[], metavar='NAME=FIRST[,LAST[,END]]',
+                        help="thresholds for one of those metrics, e.g. mem=80,90,95 or temp=,,90; "
+                             "implies --extra for it")
+    parser.add_argument('--include', nargs='*', help="only count these interfaces (glob patterns)")
+    parser.add_argument('--exclude', nargs='*', default=list(NET_EXCLUDE), help="interfaces to skip")
+    parser.add_argument('--state', help="file the network totals are kept in "
+                                         "(default: %s for live data, none otherwise)" % NET_STATE_PATH)
+    parser.add_argument('--source', choices=('live', 'synthetic'), default='live',
+                        help="where readings come from (default: live psutil counters)")
+    parser.add_argument('--cgroup', nargs='?', const='', metavar='PATH',
+                        help="monitor one cgroup v2 instead of the host, with CPU relative to its quota "
+                             "(default: this process's own cgroup)")
+    parser.add_argument('--cgroups', nargs='+', metavar='PATTERN',
+                        help="also apply the thresholds and limit to every cgroup matching these globs, "
+                             "e.g. 'system.slice/*.service'")
+    parser.add_argument('--replay', metavar='TRACE', help="replay a JSON-lines trace recorded with --output")
+    parser.add_argument('--speed', type=float,
+                        help="playback speed for --replay and --source synthetic, e.g. 1000; "
+                             "0 runs as fast as possible (default: 0 for replays, 1 otherwise)")
+    parser.add_argument('--seed', type=int, help="random seed for --source synthetic")
+    parser.add_argument('--speak', action='store_true', help="speak alerts as well as logging them")
+    parser.add_argument('--count', type=int, help="stop after this many samples")
+    parser.add_argument('--output', '-o', help="append JSON lines to this file instead of stdout")
+    parser.add_argument('--history', nargs='?', const='', metavar='PATH',
+                        help="keep samples and alerts in a local history database")
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument('--metrics-host', default='127.0.0.1', help="address the metrics endpoint binds to")
+    parser.add_argument('--fleet', metavar='ADDRESS',
+                        help="also send every sample to a cl_fleet collector at HOST:PORT or unix:PATH")
+    parser.add_argument('--fleet-name', help="name this host reports as (default: the host name)")
+    return parser
+
+
+def parse_args(argv, parser=None):
+    parser = parser or make_parser()
+    args = parser.parse_args(argv)
+    if args.interval <= 0:
+        parser.error("--interval must be positive")
+    if not 0 < args.min_interval <= args.max_interval:
+        parser.error("need 0 < --min-interval <= --max-interval")
+    if args.speed is not None and args.speed < 0:
+        parser.error("--speed cannot be negative")
+    if args.top is not None and args.top <= 0:
+        parser.error("--top must be positive")
+    if args.percpu and not have_numpy():
+        parser.error("--percpu needs numpy (pip install numpy)")
+    limits = {}
+    for text in args.metric_limit:
+        from cl_metrics import parse_limit
+        try:
+            name, levels = parse_limit(text)
+        except ValueError as exc:
+            parser.error(f"--metric-limit {text}: {exc}")
+        limits[name] = levels
+    args.metric_limit = limits
+    if args.cgroups:
+        from cl_cgroups import cgroup2_root
+        try:
+            cgroup2_root()
+        except OSError as exc:
+            parser.error(f"--cgroups: {exc}")
+    if args.fleet is not None:
+        from cl_fleet import parse_address
+        try:
+            args.fleet = parse_address(args.fleet)
+        except ValueError as exc:
+            parser.error(str(exc))
+    return args
+
+
+def open_source(args, parser):
+    if args.replay:
+        from cl_sources import TraceSource
+        try:
+            return TraceSource(args.replay, args.interval)
+        except (OSError, ValueError) as exc:
+            parser.error(f"cannot replay {args.replay}: {exc}")
+    if args.source == 'synthetic':
+        from cl_sources import SyntheticSource
+        return SyntheticSource(seed=args.seed)
+    if args.cgroup is not None:
+        from cl_cgroups import CgroupSource
+        try:
+            return CgroupSource(args.cgroup or None)
+        except (OSError, ValueError) as exc:
+            parser.error(f"cannot read cgroup: {exc}")
+    from cl_sources import live_source
+    return live_source()
+
+
+def model_ticks(source, interval, speed, stop_event):
+    # Steps a model source forward; with a speed, waits the stepped time divided by it
+    while not stop_event.is_set():
+        dt = source.step(interval())
+        if dt is None:
+            return
+        if speed:
+            stop_event.wait(dt / speed)
+        yield
+
+
+class HeadlessMonitor:
+    def __init__(self, args, out, source, metrics=None, history=None, fleet=None):
+        self.source = source
+        self.args = args
+        self.out = out
+        self.metrics = metrics
+        self.history = history
+        self.fleet = fleet
+        self.cpu = CpuReader(source)
+        self.cpu.read(args.percpu)
+        self.rules = CpuRules()
+        for level, value in enumerate((args.first, args.last, args.end), 1):
+            self.rules.set_threshold(level, value)
+        self.processes = None
+        if args.top and source.live:
+            from cl_procs import ProcessTop
+            self.processes = ProcessTop(args.top, pids=getattr(source, 'pids', None))
+        self.core_thresholds = None
+        if args.percpu:
+            self.core_thresholds = CoreThresholds()
+            for level, value in enumerate(self.rules.thresholds, 1):
+                self.core_thresholds.set_limit(level, value)
+        state = args.state or net_state_path(source)
+        self.net = NetAccounting(args.include, args.exclude, state)
+        self.net.load(source.boot_time())
+        self.net.update(source.net_io_counters())
+        if args.limit is not None and args.limit != self.net.limit_mb:
+            self.net.set_limit(args.limit)
+        self.rates = NetRates()
+        self.forecast = QuotaForecast()
+        self.cgroups = None
+        if args.cgroups:
+            from cl_cgroups import CgroupScanner
+            self.cgroups = CgroupScanner(args.cgroups)
+        self.cgroup_rules = {}  # path -> CpuRules
+        self.cgroup_net = {}  # path -> NetAccounting, for cgroups with their own network namespace
+        self.cgroup_warned = set()
+        self.extras = self.extra_rules = None
+        if (args.extra or args.metric_limit) and source.live:
+            from cl_metrics import EXTRA_METRICS, MetricRules, SystemMetrics
+            self.extras = SystemMetrics(EXTRA_METRICS if args.extra else args.metric_limit, args.metric_limit)
+            self.extras.read()  # baseline for the disk rates
+            self.extra_rules = MetricRules(args.metric_limit)
+        self.alerts = shared_speech_alerts() if args.speak else None
+        self.adaptive = None
+        if args.adaptive:
+            self.adaptive = AdaptiveInterval(args.interval, args.min_interval, args.max_interval)
+        self.last_tick = source.time()
+        self.rates.begin(self.last_tick)
+        diagnostics = shared_diagnostics()
+        self.time_cpu_read = diagnostics.timer('cpu_read')
+        self.time_rules = diagnostics.timer('cpu_rules')
+        self.time_net_read = diagnostics.timer('net_read')
+        self.time_cgroups = diagnostics.timer('cgroup_scan')
+        self.time_extras = diagnostics.timer('extra_read')
+        self.time_alert = diagnostics.timer('alert')
+        self.time_output = diagnostics.timer('output')
+
+    def interval(self):
+        return self.args.interval if self.adaptive is None else self.adaptive.current
+
+    def alert(self, record, kind, level, text):
+        with self.time_alert:
+            self.deliver(record, kind, level, text)
+
+    def deliver(self, record, kind, level, text):
+        severity = CPU_LEVELS[level][1]
+        entry = {'kind': kind, 'severity': severity, 'text': text}
+        if kind in ('cpu', 'core') and self.processes is not None and self.processes.leaders:
+            entry['top'] = top_records(self.processes.leaders)
+            text += f" Top: {top_text(self.processes.leaders)}"
+        record.setdefault('alerts', []).append(entry)
+        if self.metrics is not None:
+            self.metrics.count_alert(kind, severity)
+        if self.history is not None:
+            self.history.record_event(kind, severity, text, record['ts'])
+        if self.alerts is not None:
+            self.alerts.post(kind, severity, text)
+
+    def tick(self):
+        record = {'ts': round(self.source.time(), 3)}
+        with self.time_cpu_read:
+            total, cores = self.cpu.read(self.args.percpu)
+        if self.processes is not None:
+            self.processes.scan()
+        if total is not None:
+            record['cpu'] = total
+            with self.time_rules:
+                level = self.rules.evaluate(total)
+            if level:
+                self.alert(record, 'cpu', level, cpu_alert_text(level))
+        if cores is not None:
+            record['cores'] = cores.tolist()
+            level, hot = self.core_thresholds.evaluate(cores)
+            if level:
+                self.alert(record, 'core', level, cpu_alert_text(level, hot))
+        with self.time_net_read:
+            record['net_bytes'] = self.net.update(self.source.net_io_counters())
+        now = self.source.time()
+        elapsed, self.last_tick = max(now - self.last_tick, 1e-3), now
+        self.rates.add(now, *self.net.moved)
+        rates = self.rates.rates(now)
+        record['rates'] = {window: [round(up), round(down)] for window, (up, down) in rates.items()}
+        usage = eta = None
+        if self.net.limit_mb is not None:
+            usage = self.net.usage_mb()
+            record['net_mb'] = round(usage, 3)
+            record['limit_mb'] = self.net.limit_mb
+            for stage, level, text in self.forecast.update(usage, self.net.limit_mb, rates):
+                self.alert(record, 'net', level, text)
+            eta = self.forecast.eta
+            if eta is not None:
+                record['eta_s'] = round(eta)
+        if self.cgroups is not None:
+            with self.time_cgroups:
+                self.cgroup_tick(record)
+        extras = None
+        if self.extras is not None:
+            with self.time_extras:
+                extras = self.extras.read()
+            record.update(extras)
+            for name, level in self.extra_rules.evaluate(extras):
+                from cl_metrics import metric_alert_text
+                self.alert(record, name, level, metric_alert_text(name, level, extras[name]))
+        if self.adaptive is not None:
+            headrooms = [net_headroom(usage, self.net.limit_mb, record['net_bytes'] / elapsed / 1048576)
+                         if usage is not None else None]
+            if total is not None:
+                peak = total if cores is None else max(total, float(cores.max()))
+                headrooms.append(cpu_headroom(peak, self.rules.thresholds))
+            headrooms = [headroom for headroom in headrooms if headroom is not None]
+            record['interval'] = round(self.adaptive.update(min(headrooms) if headrooms else None), 3)
+            record['wakeups_saved'] = int(self.adaptive.wakeups_saved)
+        if self.metrics is not None:
+            self.metrics.update(
+                cpu=record.get('cpu'), cores=record.get('cores'), net_totals=self.net.nic_totals(),
+                net_mb=record.get('net_mb'), limit_mb=self.net.limit_mb, net_rates=rates, limit_eta=eta,
+                cgroups={path: reading['cpu'] for path, reading in record.get('cgroups', {}).items()
+                         if 'cpu' in reading},
+                wakeups_saved={'headless': record['wakeups_saved']} if self.adaptive else None, extras=extras)
+        if self.history is not None:
+            for metric in ('cpu', 'net_bytes', 'net_mb'):
+                if metric in record:
+                    self.history.record(metric, record[metric], record['ts'])
+            if cores is not None:
+                self.history.record('cpu_core_max', float(cores.max()), record['ts'])
+            for name, value in (extras or {}).items():
+                if name != 'disks':
+                    self.history.record(name, value, record['ts'])
+        with self.time_output:
+            self.out.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self.out.flush()
+        if self.fleet is not None:
+            self.fleet.send(record)
+
+    def cgroup_tick(self, record):
+        # The same thresholds and limit, applied to each cgroup on its own
+        readings = {}
+        for path, (cpu, counters) in self.cgroups.scan().items():
+            reading = readings[path] = {}
+            if cpu is not None:
+                reading['cpu'] = cpu
+                rules = self.cgroup_rules.get(path)
+                if rules is None:
+                    rules = self.cgroup_rules[path] = CpuRules()
+                    for level, value in enumerate(self.rules.thresholds, 1):
+                        rules.set_threshold(level, value)
+                level = rules.evaluate(cpu)
+                if level:
+                    self.alert(record, 'cgroup', level, cpu_alert_text(level, name=path))
+            if counters is None:
+                continue
+            net = self.cgroup_net.get(path)
+            if net is None:
+                net = self.cgroup_net[path] = NetAccounting(self.args.include, self.args.exclude, None)
+                net.set_limit(self.net.limit_mb)
+            reading['net_bytes'] = net.update(counters)
+            if net.limit_mb is not None:
+                usage = net.usage_mb()
+                reading['net_mb'] = round(usage, 3)
+                if usage > net.limit_mb and path not in self.cgroup_warned:
+                    self.cgroup_warned.add(path)
+                    self.alert(record, 'net', 3,
+                               f"Internet usage of {path} has exceeded the limit of {net.limit_mb} MB!")
+        for state in (self.cgroup_rules, self.cgroup_net):
+            for path in [path for path in state if path not in readings]:
+                del state[path]
+        record['cgroups'] = readings
+
+    def close(self):
+        self.net.save()
+        if self.cgroups is not None:
+            self.cgroups.close()
+        if self.extras is not None:
+            self.extras.close()
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parse_args(argv, parser)
+    source = open_source(args, parser)  # first, so a bad source is an error message and nothing else
+    out = open(args.output, 'a') if args.output else sys.stdout
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+    diagnostics = shared_diagnostics()
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda *_: diagnostics.dump())
+    metrics = exporter = None
+    if args.metrics_port is not None:
+        from cl_exporter import MetricsSnapshot, MetricsExporter
+        metrics = MetricsSnapshot(diagnostics)
+        exporter = MetricsExporter(metrics, args.metrics_host, args.metrics_port)
+        exporter.start()
+    history = None
+    if args.history is not None:
+        from cl_store import HISTORY_PATH, MetricStore
+        history = MetricStore(args.history or HISTORY_PATH)
+    fleet = None
+    if args.fleet is not None:
+        from cl_fleet import FleetAgent
+        fleet = FleetAgent(args.fleet, args.fleet_name)
+        fleet.start()
+    monitor = HeadlessMonitor(args, out, source, metrics, history, fleet)
+    if source.live:
+        schedule = ticks(monitor.interval, stop_event)
+    else:
+        speed = args.speed if args.speed is not None else (0 if args.replay else 1)
+        schedule = model_ticks(source, monitor.interval, speed, stop_event)
+    ticking = diagnostics.timer('tick')
+    lag = diagnostics.histogram('tick_lag')
+    try:
+        for count, late in enumerate(schedule, 1):
+            if late is not None:
+                lag.observe(late)
+            with ticking:
+                monitor.tick()
+            if args.count and count >= args.count:
+                break
+    finally:
+        monitor.close()
+        if exporter is not None:
+            exporter.stop()
+        if history is not None:
+            history.close()
+        if fleet is not None:
+            fleet.stop()
+        if hasattr(source, 'close'):
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+# Memory, swap, disk throughput, load average and temperature, gathered in
+# one pass per sampler tick and shared by every consumer: the headless
+# lines, the window, history, the metrics endpoint and the threshold
+# rules. Linux reads /proc and /sys through handles kept open; elsewhere
+# psutil is used.
+import glob
+import os
+import sys
+import threading
+import time
+
+from cl_core import SAMPLE_INTERVAL, CPU_LEVELS, CpuRules, ticks
+from cl_diag import shared_diagnostics
+
+EXTRA_METRICS = {
+    # name -> (what alerts call it, unit, hysteresis in that unit)
+    'mem': ('Memory usage', '%', 5.0),
+    'swap': ('Swap usage', '%', 5.0),
+    'disk_read': ('Disk reads', ' MB/s', 5.0),
+    'disk_write': ('Disk writes', ' MB/s', 5.0),
+    'load': ('Load average', '', 0.5),
+    'temp': ('Temperature', ' °C', 3.0),
+}
+TEMP_EVERY = 5.0  # seconds between sensor reads, which can be slow on some drivers
+DISK_SKIP = ('loop', 'ram', 'zram', 'dm-', 'md')  # virtual, or already counted on the disks below
+
+
+def parse_limit(text):
+    # "mem=80,90,95" -> ('mem', (80.0, 90.0, 95.0)); empty levels stay unset
+    name, equals, values = text.partition('=')
+    if not equals or name not in EXTRA_METRICS:
+        raise ValueError(f"expected NAME=FIRST[,LAST[,END]] with NAME one of {', '.join(EXTRA_METRICS)}")
+    levels = [float(value) if value else None for value in values.split(',')]
+    if not 1 <= len(levels) <= 3:
+        raise ValueError("give one to three thresholds")
+    return name, tuple(levels + [None] * (3 - len(levels)))
+
+
+def metric_alert_text(name, level, value):
+    label, unit, _ = EXTRA_METRICS[name]
+    return f'Warning: {label} is {CPU_LEVELS[level][0]} ({value}{unit})!'
+
+
+def extras_text(readings):
+    parts = []
+    for name in ('mem', 'swap', 'load', 'temp'):
+        if readings.get(name) is not None:
+            label, unit, _ = EXTRA_METRICS[name]
+            parts.append(f"{label.split()[0].lower()} {readings[name]}{unit}")
+    if readings.get('disk_read') is not None:
+        parts.append(f"disk {readings['disk_read']}/{readings['disk_write']} MB/s")
+    return '  '.join(parts)
+
+
+class ProcfsMetrics:
+    # One preadv per file per pass; buffers grow if a file outgrows them
+    def __init__(self):
+        self.mem_fd = os.open('/proc/meminfo', os.O_RDONLY)
+        self.disk_fd = os.open('/proc/diskstats', os.O_RDONLY)
+        self.load_fd = os.open('/proc/loadavg', os.O_RDONLY)
+        self.buffer = bytearray(8192)
+        self.disks = {name for name in os.listdir('/sys/block') if not name.startswith(DISK_SKIP)}
+        sensors = glob.glob('/sys/class/hwmon/hwmon*/temp*_input') or glob.glob('/sys/class/thermal/thermal_zone*/temp')
+        self.sensor_fds = []
+        for path in sensors:
+            try:
+                self.sensor_fds.append(os.open(path, os.O_RDONLY))
+            except OSError:
+                pass
+
+    def fill(self, fd):
+        while True:
+            size = os.preadv(fd, [self.buffer], 0)
+            if size < len(self.buffer):
+                return bytes(self.buffer[:size])
+            self.buffer = bytearray(len(self.buffer) * 2)
+
+    def memory(self):
+        # (memory used %, swap used % or None without swap)
+        fields = {}
+        for line in self.fill(self.mem_fd).split(b'\n'):
+            name, colon, rest = line.partition(b':')
+            if name in (b'MemTotal', b'MemAvailable', b'SwapTotal', b'SwapFree'):
+                fields[name] = int(rest.split()[0])
+        mem = 100.0 * (1 - fields[b'MemAvailable'] / fields[b'MemTotal'])
+        swap = 100.0 * (1 - fields[b'SwapFree'] / fields[b'SwapTotal']) if fields[b'SwapTotal'] else None
+        return mem, swap
+
+    def disk_bytes(self):
+        # {disk: (bytes read, bytes written)}; diskstats sectors are always 512 bytes
+        counters = {}
+        for line in self.fill(self.disk_fd).split(b'\n'):
+            values = line.split()
+            if len(values) >= 10:
+                name = values[2].decode()
+                if name in self.disks:
+                    counters[name] = (int(values[5]) * 512, int(values[9]) * 512)
+        return counters
+
+    def load(self):
+        return float(self.fill(self.load_fd).split(None, 1)[0])
+
+    def temperature(self):
+        # Hottest sensor in °C, or None without readable sensors
+        hottest = None
+        for fd in self.sensor_fds:
+            try:
+                value = int(os.pread(fd, 32, 0)) / 1000.0
+            except (OSError, ValueError):
+                continue
+            if hottest is None or value > hottest:
+                hottest = value
+        return hottest
+
+    def close(self):
+        for fd in (self.mem_fd, self.disk_fd, self.load_fd, *self.sensor_fds):
+            os.close(fd)
+
+
+class PsutilMetrics:
+    def __init__(self):
+        import psutil
+        self.psutil = psutil
+
+    def memory(self):
+        swap = self.psutil.swap_memory()
+        return self.psutil.virtual_memory().percent, swap.percent if swap.total else None
+
+    def disk_bytes(self):
+        counters = self.psutil.disk_io_counters(perdisk=True) or {}
+        return {name: (c.read_bytes, c.write_bytes) for name, c in counters.items() if not name.startswith(DISK_SKIP)}
+
+    def load(self):
+        return os.getloadavg()[0] if hasattr(os, 'getloadavg') else self.psutil.getloadavg()[0]
+
+    def temperature(self):
+        if not hasattr(self.psutil, 'sensors_temperatures'):
+            return None
+        readings = [entry.current for entries in self.psutil.sensors_temperatures().values() for entry in entries]
+        return max(readings) if readings else None
+
+
+def metric_source():
+    # The /proc fast path on Linux, psutil everywhere else
+    if sys.platform.startswith('linux') and hasattr(os, 'preadv'):
+        try:
+            return ProcfsMetrics()
+        except (OSError, ValueError):
+            pass
+    return PsutilMetrics()
+
+
+class SystemMetrics:
+    # read() is the one collection pass: every enabled metric, with disk
+    # counters turned into MB/s since the previous pass. limits holds the
+    # thresholds consumers build their MetricRules from.
+    def __init__(self, names=tuple(EXTRA_METRICS), limits=None, source=None, temp_every=TEMP_EVERY):
+        self.names = set(names) | set(limits or ())
+        self.limits = limits or {}
+        self.source = source
+        self.temp_every = temp_every
+        self.disks = None
+        self.disks_read = 0.0
+        self.temp = None
+        self.temp_read = float('-inf')
+
+    def read(self):
+        if self.source is None:
+            self.source = metric_source()
+        readings = {}
+        names = self.names
+        if 'mem' in names or 'swap' in names:
+            mem, swap = self.source.memory()
+            readings['mem'] = round(mem, 1)
+            if swap is not None:
+                readings['swap'] = round(swap, 1)
+        if 'disk_read' in names or 'disk_write' in names:
+            now = time.monotonic()
+            disks = self.source.disk_bytes()
+            if self.disks is not None and now > self.disks_read:
+                elapsed = (now - self.disks_read) * 1048576
+                rates = {name: (max(0, read - self.disks[name][0]) / elapsed,
+                                max(0, written - self.disks[name][1]) / elapsed)
+                         for name, (read, written) in disks.items() if name in self.disks}
+                readings['disk_read'] = round(sum(read for read, written in rates.values()), 2)
+                readings['disk_write'] = round(sum(written for read, written in rates.values()), 2)
+                readings['disks'] = {name: [round(read, 2), round(written, 2)] for name, (read, written) in rates.items()}
+            self.disks, self.disks_read = disks, now
+        if 'load' in names:
+            readings['load'] = round(self.source.load(), 2)
+        if 'temp' in names:
+            now = time.monotonic()
+            if now - self.temp_read >= self.temp_every:
+                self.temp, self.temp_read = self.source.temperature(), now
+            if self.temp is not None:
+                readings['temp'] = round(self.temp, 1)
+        return readings
+
+    def close(self):
+        if hasattr(self.source, 'close'):
+            self.source.close()
+
+
+class MetricSampler:
+    # The window's collection pass: a SystemMetrics read on its own thread
+    # every interval, whichever pages are open, with each pass handed to
+    # on_readings from that thread
+    def __init__(self, metrics, on_readings=None, interval=SAMPLE_INTERVAL):
+        self.metrics = metrics
+        self.on_readings = on_readings
+        self.interval = interval
+        self.thread = None
+        self.stop_event = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(self.stop_event,), name="metric-sampler", daemon=True)
+        self.thread.start()
+
+    def run(self, stop_event):
+        reading = shared_diagnostics().timer('extra_read')
+        self.metrics.read()  # baseline for the disk rates
+        for late in ticks(lambda: self.interval, stop_event):
+            with reading:
+                readings = self.metrics.read()
+            if self.on_readings is not None:
+                self.on_readings(readings)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
+        self.metrics.close()
+
+
+class MetricRules:
+    # The CPU threshold rules, one instance per metric with a limit
+    def __init__(self, limits):
+        self.rules = {}
+        for name, levels in limits.items():
+            rules = self.rules[name] = CpuRules(hysteresis=EXTRA_METRICS[name][2])
+            for level, value in enumerate(levels, 1):
+                rules.set_threshold(level, value)
+
+    def evaluate(self, readings):
+        # [(name, level)] for every metric that rose to a new level
+        raised = []
+        for name, rules in self.rules.items():
+            if readings.get(name) is not None:
+                level = rules.evaluate(readings[name])
+                if level:
+                    raised.append((name, level))
+        return raised
@@ -0,0 +1,71 @@
+# Which processes are using the CPU, so an alert can name the culprits.
+# Only meaningful for live readings; needs psutil.
+import heapq
+import time
+
+TOP_COUNT = 5
+SCAN_BUDGET = 300  # processes read per scan
+
+
+class ProcessTop:
+    # psutil.Process objects are kept between scans and each one is diffed
+    # against its own previous CPU times. A scan reads at most budget
+    # processes, round robin over the process table, so its cost does not
+    # grow with the number of processes; a process's share is averaged over
+    # the time since it was last read. Shares are percent of one core, as in
+    # top, so a busy multi-threaded process can exceed 100.
+    def __init__(self, count=TOP_COUNT, budget=SCAN_BUDGET, pids=None):
+        import psutil
+        self.psutil = psutil
+        self.count = count
+        self.budget = budget
+        self.pids = pids or psutil.pids  # e.g. only the members of a cgroup
+        self.procs = {}  # pid -> [Process, name, cpu seconds, read at, percent]
+        self.pending = []  # pids still to read in this pass, last one first
+        self.leaders = []  # [(percent, pid, name)], highest first
+
+    def read(self, pid):
+        psutil = self.psutil
+        entry = self.procs.get(pid)
+        try:
+            if entry is None:
+                proc = psutil.Process(pid)
+                with proc.oneshot():  # name and times come from the same /proc read
+                    name = proc.name()
+                    times = proc.cpu_times()
+                self.procs[pid] = [proc, name, times.user + times.system, time.monotonic(), 0.0]
+                return
+            times = entry[0].cpu_times()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self.procs.pop(pid, None)
+            return
+        now = time.monotonic()
+        used = times.user + times.system
+        if used < entry[2]:
+            # CPU time went backwards: the pid now belongs to another process
+            del self.procs[pid]
+            return
+        entry[4] = 100.0 * (used - entry[2]) / max(now - entry[3], 1e-3)
+        entry[2], entry[3] = used, now
+
+    def scan(self):
+        if not self.pending:
+            pids = self.pids()
+            alive = set(pids)
+            for pid in [pid for pid in self.procs if pid not in alive]:
+                del self.procs[pid]
+            pids.reverse()
+            self.pending = pids
+        for _ in range(min(self.budget, len(self.pending))):
+            self.read(self.pending.pop())
+        self.leaders = heapq.nlargest(
+            self.count, ((entry[4], pid, entry[1]) for pid, entry in self.procs.items() if entry[4] >= 0.1))
+        return self.leaders
+
+
+def top_text(leaders, limit=3):
+    return ', '.join(f"{name} ({percent:.0f}%)" for percent, pid, name in leaders[:limit])
+
+
+def top_records(leaders):
+    return [{'pid': pid, 'name': name, 'cpu': round(percent, 1)} for percent, pid, name in leaders]
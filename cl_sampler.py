@@ -0,0 +1,302 @@
+# CPU sampling in a separate process. The child runs the usual CpuSampler
+# loop and writes every reading into a multiprocessing.shared_memory ring;
+# the window maps the same memory and reads only slots it has not seen, so
+# collection never holds the window's GIL. Started with
+# `python "CL Center.py" --sampler-process`; this file is the child.
+import argparse
+import math
+import os
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+from cl_core import SAMPLE_INTERVAL, AdaptiveInterval, CpuSampler
+
+MAGIC = 0x434c5331  # "CLS1"
+SLOTS = 64
+MAX_CORES = 256
+TOP_SLOTS = 5
+PERCPU = 1
+TOP = 2
+POLLS_PER_SAMPLE = 4  # times the window looks for new samples per sampling interval
+POLL_MIN = 0.05  # seconds between looks, at least
+POLL_MAX = 1.0  # and at most, so a dead child is noticed quickly at slow intervals
+
+# Header: magic, slots, max cores, flags, samples written, interval, thresholds x3
+HEADER = struct.Struct('<IIIIQd3d')
+HEAD_AT = 16  # offset of "samples written"
+CONTROL = struct.Struct('<I')  # flags, at offset 12
+CONTROL_AT = 12
+SETTINGS = struct.Struct('<d3d')  # interval and thresholds, at offset 24
+SETTINGS_AT = 24
+SEQ = struct.Struct('<Q')
+# Slot: sequence, ts, cpu, interval, wakeups saved, cores, top entries, then
+# the per-core values and the top processes
+SLOT = struct.Struct('<QddddII')
+TOP_ENTRY = struct.Struct('<Id16s')
+SLOT_SIZE = SLOT.size + 8 * MAX_CORES + TOP_ENTRY.size * TOP_SLOTS
+SIZE = HEADER.size + SLOTS * SLOT_SIZE
+
+
+def attach(name):
+    # Map an existing ring without letting this process's resource tracker
+    # unlink it on exit; only the window that created it does that
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # Python < 3.13
+        from multiprocessing import resource_tracker
+        memory = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+
+class SampleRing:
+    # Lock-free single-writer ring. A slot's sequence number is odd while the
+    # child writes it and 2 * (n + 1) once sample n is complete, so a reader
+    # that sees the same even number before and after copying a slot has a
+    # whole sample; anything else was overwritten under it and is skipped.
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner
+        self.buf = memory.buf
+
+    @classmethod
+    def create(cls):
+        memory = shared_memory.SharedMemory(create=True, size=SIZE)
+        memory.buf[:SIZE] = bytes(SIZE)
+        HEADER.pack_into(memory.buf, 0, MAGIC, SLOTS, MAX_CORES, 0, 0, SAMPLE_INTERVAL, math.nan, math.nan, math.nan)
+        return cls(memory, True)
+
+    @classmethod
+    def open(cls, name):
+        ring = cls(attach(name), False)
+        if HEADER.unpack_from(ring.buf, 0)[:3] != (MAGIC, SLOTS, MAX_CORES):
+            ring.close()
+            raise ValueError(f"{name} is not a CL Center sample ring")
+        return ring
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def written(self):
+        return SEQ.unpack_from(self.buf, HEAD_AT)[0]
+
+    # Control block: written by the window, read by the child once per tick
+
+    def set_control(self, flags, interval, thresholds):
+        CONTROL.pack_into(self.buf, CONTROL_AT, flags)
+        SETTINGS.pack_into(self.buf, SETTINGS_AT, interval,
+                           *(math.nan if value is None else value for value in thresholds))
+
+    def control(self):
+        flags, = CONTROL.unpack_from(self.buf, CONTROL_AT)
+        interval, *thresholds = SETTINGS.unpack_from(self.buf, SETTINGS_AT)
+        return flags, interval, tuple(None if math.isnan(value) else value for value in thresholds)
+
+    # Samples
+
+    def write(self, ts, cpu, cores, interval, wakeups_saved, leaders):
+        n = self.written()
+        at = HEADER.size + (n % SLOTS) * SLOT_SIZE
+        buf = self.buf
+        SEQ.pack_into(buf, at, 2 * n + 1)
+        count = 0 if cores is None else min(len(cores), MAX_CORES)
+        top = leaders[:TOP_SLOTS]
+        SLOT.pack_into(buf, at, 2 * n + 1, ts, cpu, interval, wakeups_saved, count, len(top))
+        if count:
+            struct.pack_into(f'<{count}d', buf, at + SLOT.size, *[float(value) for value in cores[:count]])
+        entry_at = at + SLOT.size + 8 * MAX_CORES
+        for percent, pid, name in top:
+            TOP_ENTRY.pack_into(buf, entry_at, pid, percent, name.encode()[:16])
+            entry_at += TOP_ENTRY.size
+        SEQ.pack_into(buf, at, 2 * n + 2)
+        SEQ.pack_into(buf, HEAD_AT, n + 1)
+
+    def read(self, n):
+        # Sample n as (ts, cpu, cores or None, interval, wakeups saved, leaders), or None if overwritten
+        at = HEADER.size + (n % SLOTS) * SLOT_SIZE
+        buf = self.buf
+        seq, ts, cpu, interval, wakeups_saved, count, ntop = SLOT.unpack_from(buf, at)
+        if seq != 2 * n + 2:
+            return None
+        cores = struct.unpack_from(f'<{count}d', buf, at + SLOT.size) if count else None
+        leaders = []
+        entry_at = at + SLOT.size + 8 * MAX_CORES
+        for _ in range(ntop):
+            pid, percent, name = TOP_ENTRY.unpack_from(buf, entry_at)
+            leaders.append((percent, pid, name.rstrip(b'\0').decode(errors='replace')))
+            entry_at += TOP_ENTRY.size
+        if SEQ.unpack_from(buf, at)[0] != seq:
+            return None
+        return ts, cpu, cores, interval, wakeups_saved, leaders
+
+    def close(self):
+        self.buf = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class SharedLeaders:
+    # Stands in for ProcessTop in the window; the child does the scanning
+    def __init__(self):
+        self.leaders = []
+
+
+class SharedSampler:
+    # Same surface as CpuSampler for the CPU page, but the samples come from
+    # a child process. poll() is called from the window's event loop; it
+    # hands on new samples, pushes percpu/processes/thresholds to the child
+    # and restarts it, with a growing delay, if it has died.
+    def __init__(self, interval=SAMPLE_INTERVAL, on_sample=None, on_cores=None, adaptive=None, cgroup=None):
+        self.interval = interval
+        self.on_sample = on_sample
+        self.on_cores = on_cores
+        self.adaptive = adaptive
+        self.cgroup = cgroup
+        self.thresholds = (None, None, None)
+        self.percpu = False
+        self.processes = None
+        self.ring = SampleRing.create()
+        self.seen = 0
+        self.child = None
+        self.started_at = 0.0
+        self.restart_delay = 1.0
+        self.restarts = 0
+        self.np = None
+
+    def set_interval(self, interval):
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive.")
+        self.interval = interval
+        if self.adaptive is not None:
+            self.adaptive.base = interval
+
+    def poll_interval(self):
+        # How long the window should wait between polls at the current sampling interval
+        current = self.adaptive.current if self.adaptive is not None else self.interval
+        return max(POLL_MIN, min(POLL_MAX, current / POLLS_PER_SAMPLE))
+
+    def push_control(self):
+        flags = (PERCPU if self.percpu else 0) | (TOP if self.processes is not None else 0)
+        self.ring.set_control(flags, self.interval, self.thresholds)
+
+    def start(self):
+        if self.child is not None:
+            return
+        self.push_control()
+        command = [sys.executable, os.path.abspath(__file__), '--shm', self.ring.name]
+        if self.cgroup is not None:
+            command += ['--cgroup', self.cgroup]
+        if self.adaptive is not None:
+            command += ['--adaptive', str(self.adaptive.min_interval), str(self.adaptive.max_interval)]
+        self.child = subprocess.Popen(command, stdin=subprocess.DEVNULL)
+        self.started_at = time.monotonic()
+        self.seen = self.ring.written()
+
+    def poll(self):
+        if self.child is None:
+            return
+        self.push_control()
+        code = self.child.poll()
+        if code is not None:
+            now = time.monotonic()
+            if now - self.started_at > 60:
+                self.restart_delay = 1.0  # it had been running fine
+            if now - self.started_at >= self.restart_delay:
+                print(f"cl_sampler exited with code {code}, restarting", file=sys.stderr)
+                self.child = None
+                self.restarts += 1
+                self.restart_delay = min(self.restart_delay * 2, 30.0)
+                self.start()
+            return
+        written = self.ring.written()
+        for n in range(max(self.seen, written - SLOTS), written):
+            sample = self.ring.read(n)
+            if sample is None:
+                continue
+            ts, cpu, cores, interval, wakeups_saved, leaders = sample
+            if self.adaptive is not None:
+                self.adaptive.current = interval
+                self.adaptive.wakeups_saved = wakeups_saved
+            if self.processes is not None:
+                self.processes.leaders = leaders
+            if self.on_sample is not None:
+                self.on_sample(cpu)
+            if cores is not None and self.percpu and self.on_cores is not None:
+                if self.np is None:
+                    import numpy
+                    self.np = numpy
+                self.on_cores(self.np.array(cores))
+        self.seen = written
+
+    def stop(self):
+        if self.child is None:
+            return
+        self.child.terminate()
+        try:
+            self.child.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.child.kill()
+            self.child.wait()
+        self.child = None
+
+    def close(self):
+        self.stop()
+        self.ring.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cl_sampler", description="CL Center sampler child process.")
+    parser.add_argument('--shm', required=True, help="name of the shared memory ring to write to")
+    parser.add_argument('--cgroup', help="sample this cgroup instead of the host")
+    parser.add_argument('--adaptive', nargs=2, type=float, metavar=('MIN', 'MAX'))
+    args = parser.parse_args(argv)
+
+    ring = SampleRing.open(args.shm)
+    source = None
+    if args.cgroup is not None:
+        from cl_cgroups import CgroupSource
+        source = CgroupSource(args.cgroup)
+    interval = ring.control()[1]
+    adaptive = AdaptiveInterval(interval, *args.adaptive) if args.adaptive else None
+    parent = os.getppid()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    def apply_control():
+        flags, sampler.interval, sampler.thresholds = ring.control()
+        if adaptive is not None:
+            adaptive.base = sampler.interval
+        sampler.percpu = bool(flags & PERCPU)
+        if flags & TOP and sampler.processes is None:
+            from cl_procs import ProcessTop
+            sampler.processes = ProcessTop(TOP_SLOTS, pids=getattr(sampler.source, 'pids', None))
+        elif not flags & TOP:
+            sampler.processes = None
+
+    def on_reading(total, cores):
+        leaders = sampler.processes.leaders if sampler.processes is not None else []
+        current = adaptive.current if adaptive is not None else sampler.interval
+        wakeups_saved = adaptive.wakeups_saved if adaptive is not None else 0.0
+        ring.write(time.time(), total, cores, current, wakeups_saved, leaders)
+        if os.getppid() != parent:
+            stop_event.set()  # the window is gone
+        apply_control()
+
+    sampler = CpuSampler(interval, adaptive=adaptive, source=source, on_reading=on_reading)
+    apply_control()
+    try:
+        sampler.run(stop_event)
+    finally:
+        ring.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
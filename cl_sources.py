@@ -0,0 +1,246 @@
+# Where the monitors get their readings from. Every source offers the same
+# calls as the psutil functions the monitors use, so the threshold and limit
+# logic runs unchanged against live counters, a synthetic load or a recorded
+# trace. A trace is the JSON-lines output of the headless monitor.
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+
+ModelCpuTimes = namedtuple('ModelCpuTimes', 'user idle')
+ModelNetIO = namedtuple('ModelNetIO', 'bytes_sent bytes_recv')
+ProcNetIO = namedtuple('ProcNetIO', 'bytes_sent bytes_recv')
+PROC_CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice')
+
+
+class PsutilSource:
+    live = True
+
+    def __init__(self):
+        import psutil
+        self.psutil = psutil
+
+    def cpu_times(self, percpu=False):
+        return self.psutil.cpu_times(percpu=percpu)
+
+    def net_io_counters(self):
+        return self.psutil.net_io_counters(pernic=True)
+
+    def boot_time(self):
+        return self.psutil.boot_time()
+
+    def time(self):
+        return time.time()
+
+
+def parse_btime(stat):
+    # Boot time in seconds since the epoch, from the contents of /proc/stat
+    return float(stat.split(b'btime ', 1)[1].split(None, 1)[0])
+
+
+class ProcNetDev:
+    # One net/dev file (the host's, or /proc/<pid>/net/dev for another
+    # network namespace) kept open and re-read from offset 0 into a reused
+    # buffer. Interface names are decoded once and cached.
+    def __init__(self, path='/proc/net/dev'):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(16384)
+        self.names = {}
+
+    def read(self):
+        buffer = self.buffer
+        size = os.preadv(self.fd, [buffer], 0)
+        if size == len(buffer):
+            self.buffer = bytearray(len(buffer) * 2)
+            return self.read()
+        counters = {}
+        names = self.names
+        start = buffer.index(b'\n', buffer.index(b'\n') + 1) + 1  # two header lines
+        while start < size:
+            end = buffer.index(b'\n', start, size)
+            colon = buffer.index(b':', start, end)
+            raw = bytes(buffer[start:colon])
+            name = names.get(raw)
+            if name is None:
+                name = names[raw] = raw.strip().decode()
+            values = buffer[colon + 1:end].split()
+            counters[name] = ProcNetIO(int(values[8]), int(values[0]))
+            start = end + 1
+        return counters
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ProcfsSource:
+    # Linux fast path for the live counters. /proc/stat and /proc/net/dev are
+    # opened once and re-read from offset 0 with preadv into buffers that are
+    # reused every tick; only the cpu lines of /proc/stat are parsed, and
+    # bytes are not decoded except for interface names, which are cached.
+    # The results have the same fields and units as psutil's.
+    live = True
+
+    def __init__(self, stat_path='/proc/stat', net_path='/proc/net/dev'):
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        with open(stat_path, 'rb') as f:
+            stat = f.read()
+        self.btime = parse_btime(stat)
+        fields = PROC_CPU_FIELDS[:len(stat.split(b'\n', 1)[0].split()) - 1]
+        self.cpu_times_type = namedtuple('scputimes', fields)
+        # The cpu lines come first, so the buffer only needs to hold those
+        self.stat_buffer = bytearray(stat.index(b'\nintr') + 4096 if b'\nintr' in stat else len(stat) + 4096)
+        self.stat_fd = os.open(stat_path, os.O_RDONLY)
+        self.net = ProcNetDev(net_path)
+
+    def fill(self, fd, buffer):
+        # Returns the number of bytes read; a full buffer may mean truncation
+        return os.preadv(fd, [buffer], 0)
+
+    def cpu_times(self, percpu=False):
+        buffer = self.stat_buffer
+        size = self.fill(self.stat_fd, buffer)
+        ticks = self.ticks
+        make = self.cpu_times_type
+        if not percpu:
+            line = buffer[:buffer.index(b'\n')].split()
+            return make(*[int(value) / ticks for value in line[1:len(make._fields) + 1]])
+        cores = []
+        start = buffer.index(b'\n') + 1
+        while buffer.startswith(b'cpu', start, size):
+            end = buffer.find(b'\n', start, size)
+            if end < 0:
+                break
+            line = buffer[start:end].split()
+            cores.append(make(*[int(value) / ticks for value in line[1:len(make._fields) + 1]]))
+            start = end + 1
+        else:
+            if start < size:
+                return cores
+        # The buffer ended inside the cpu lines (more cores came online); grow it and start over
+        self.stat_buffer = bytearray(len(buffer) * 2)
+        return self.cpu_times(percpu)
+
+    def net_io_counters(self):
+        return self.net.read()
+
+    def boot_time(self):
+        return self.btime
+
+    def time(self):
+        return time.time()
+
+    def close(self):
+        os.close(self.stat_fd)
+        self.net.close()
+
+
+def live_source():
+    # The /proc fast path on Linux, psutil everywhere else
+    if sys.platform.startswith('linux') and hasattr(os, 'preadv'):
+        try:
+            return ProcfsSource()
+        except (OSError, ValueError, IndexError):
+            pass
+    return PsutilSource()
+
+
+class ModelSource:
+    # Builds cumulative CPU-time and byte counters out of per-step values, so
+    # readers that diff counters get those values back exactly.
+    live = False
+    cores = 4
+
+    def __init__(self, start=0.0):
+        self.ts = start
+        self.core_times = [[0.0, 0.0] for _ in range(self.cores)]
+        self.received = 0
+        self.sent = 0
+
+    def advance(self, dt, cpu, cores=None, net_bytes=0):
+        if cores is None or len(cores) != len(self.core_times):
+            cores = [cpu] * len(self.core_times)
+        for times, busy in zip(self.core_times, cores):
+            times[0] += dt * busy / 100.0
+            times[1] += dt * (100.0 - busy) / 100.0
+        self.received += int(net_bytes)
+        self.ts += dt
+
+    def cpu_times(self, percpu=False):
+        if percpu:
+            return [ModelCpuTimes(*times) for times in self.core_times]
+        return ModelCpuTimes(sum(t[0] for t in self.core_times), sum(t[1] for t in self.core_times))
+
+    def net_io_counters(self):
+        return {'model0': ModelNetIO(self.sent, self.received)}
+
+    def boot_time(self):
+        return 0.0
+
+    def time(self):
+        return self.ts
+
+
+class SyntheticSource(ModelSource):
+    # A daily-ish wave with noise and occasional spikes on one core
+    def __init__(self, cores=4, base=30.0, amplitude=25.0, period=600.0, noise=5.0,
+                 spike_chance=0.01, net_rate=200_000, seed=None, start=None):
+        self.cores = cores
+        super().__init__(time.time() if start is None else start)
+        self.base = base
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.spike_chance = spike_chance
+        self.net_rate = net_rate
+        self.random = random.Random(seed)
+        self.spike = 0
+
+    def step(self, dt):
+        wave = self.base + self.amplitude * math.sin(2 * math.pi * self.ts / self.period)
+        values = [min(100.0, max(0.0, wave + self.random.gauss(0, self.noise))) for _ in range(self.cores)]
+        if self.spike or self.random.random() < self.spike_chance:
+            self.spike = self.spike - 1 if self.spike else self.random.randint(3, 30)
+            values[0] = 100.0
+        net = self.net_rate * dt * max(0.0, 1 + self.random.gauss(0, 0.3))
+        self.advance(dt, sum(values) / len(values), values, net)
+        return dt
+
+
+class TraceSource(ModelSource):
+    # Streams a recorded trace one line at a time; lines without a CPU value
+    # are skipped. step() returns the recorded gap to the next sample.
+    def __init__(self, path, default_interval=1.0):
+        self.file = open(path)
+        self.default_interval = default_interval
+        self.pending = self.next_record()
+        if self.pending is not None and self.pending.get('cores'):
+            self.cores = len(self.pending['cores'])
+        start = self.pending['ts'] - default_interval if self.pending is not None else 0.0
+        super().__init__(start)
+
+    def next_record(self):
+        for line in self.file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('cpu') is not None and 'ts' in record:
+                return record
+        return None
+
+    def step(self, dt=None):
+        record = self.pending
+        if record is None:
+            return None
+        self.pending = self.next_record()
+        gap = record['ts'] - self.ts
+        if gap <= 0:
+            gap = self.default_interval
+        self.advance(gap, record['cpu'], record.get('cores'), record.get('net_bytes', 0))
+        return gap
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,166 @@
+# Local time-series history in SQLite (WAL mode). Samples are buffered in
+# memory and written in batches by a background thread, which also rolls
+# raw samples up into 1 minute and 1 hour buckets and enforces retention.
+import os
+import sqlite3
+import threading
+import time
+
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cl_center", "history.db")
+RETENTION = {'raw': 2 * 86400, '1m': 30 * 86400, '1h': 730 * 86400,  # seconds kept per table
+             'events': 365 * 86400}  # alerts are few and worth keeping for capacity reviews
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS samples (ts REAL NOT NULL, metric INTEGER NOT NULL, value REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS samples_metric_ts ON samples (metric, ts);
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+CREATE TABLE IF NOT EXISTS samples_1m (
+    metric INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL, total REAL NOT NULL, low REAL NOT NULL, high REAL NOT NULL,
+    PRIMARY KEY (metric, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_1m_bucket ON samples_1m (bucket);
+CREATE TABLE IF NOT EXISTS samples_1h (
+    metric INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL, total REAL NOT NULL, low REAL NOT NULL, high REAL NOT NULL,
+    PRIMARY KEY (metric, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_1h_bucket ON samples_1h (bucket);
+CREATE TABLE IF NOT EXISTS events (ts REAL NOT NULL, kind TEXT NOT NULL, severity TEXT NOT NULL, text TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS watermarks (name TEXT PRIMARY KEY, until REAL NOT NULL);
+"""
+
+ROLLUP = """
+INSERT INTO {target} (metric, bucket, count, total, low, high)
+SELECT metric, CAST({time} / {width} AS INTEGER) * {width}, {count}, {total}, {low}, {high}
+FROM {source} WHERE {time} >= ? AND {time} < ?
+GROUP BY metric, CAST({time} / {width} AS INTEGER)
+ON CONFLICT (metric, bucket) DO UPDATE SET
+    count = count + excluded.count, total = total + excluded.total,
+    low = MIN(low, excluded.low), high = MAX(high, excluded.high)
+"""
+ROLLUPS = (
+    ('1m', 60, dict(target='samples_1m', source='samples', time='ts',
+                    count='COUNT(*)', total='SUM(value)', low='MIN(value)', high='MAX(value)')),
+    ('1h', 3600, dict(target='samples_1h', source='samples_1m', time='bucket',
+                      count='SUM(count)', total='SUM(total)', low='MIN(low)', high='MAX(high)')),
+)
+
+
+def connect(path):
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new file
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class MetricStore:
+    def __init__(self, path=HISTORY_PATH, flush_every=5.0, rollup_every=60.0, retention=RETENTION):
+        self.path = path
+        self.flush_every = flush_every
+        self.rollup_every = rollup_every
+        self.retention = dict(RETENTION, **retention)
+        self.lock = threading.Lock()
+        self.samples = []
+        self.events = []
+        self.metric_ids = {}
+        self.last_rollup = 0.0
+        self.stop_event = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = connect(path)
+        self.db.executescript(SCHEMA)
+        self.metric_ids = dict(self.db.execute("SELECT name, id FROM metrics"))
+        self.reader = None
+        self.reader_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="metric-store", daemon=True)
+        self.thread.start()
+
+    def record(self, metric, value, ts=None):
+        with self.lock:
+            self.samples.append((time.time() if ts is None else ts, metric, value))
+
+    def record_event(self, kind, severity, text, ts=None):
+        with self.lock:
+            self.events.append((time.time() if ts is None else ts, kind, severity, text))
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_every):
+            self.flush()
+            if time.monotonic() - self.last_rollup >= self.rollup_every:
+                self.rollup()
+        self.flush()
+
+    def metric_id(self, name):
+        metric = self.metric_ids.get(name)
+        if metric is None:
+            self.db.execute("INSERT OR IGNORE INTO metrics (name) VALUES (?)", (name,))
+            metric = self.db.execute("SELECT id FROM metrics WHERE name = ?", (name,)).fetchone()[0]
+            self.metric_ids[name] = metric
+        return metric
+
+    def flush(self):
+        with self.lock:
+            samples, self.samples = self.samples, []
+            events, self.events = self.events, []
+        if not samples and not events:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO samples (ts, metric, value) VALUES (?, ?, ?)",
+                [(ts, self.metric_id(name), value) for ts, name, value in samples])
+            self.db.executemany("INSERT INTO events (ts, kind, severity, text) VALUES (?, ?, ?, ?)", events)
+
+    def rollup(self, now=None):
+        now = time.time() if now is None else now
+        with self.db:
+            for name, width, parts in ROLLUPS:
+                row = self.db.execute("SELECT until FROM watermarks WHERE name = ?", (name,)).fetchone()
+                start = row[0] if row else 0.0
+                end = now // width * width
+                if end <= start:
+                    continue
+                self.db.execute(ROLLUP.format(width=width, **parts), (start, end))
+                self.db.execute("INSERT OR REPLACE INTO watermarks (name, until) VALUES (?, ?)", (name, end))
+            self.db.execute("DELETE FROM samples WHERE ts < ?", (now - self.retention['raw'],))
+            self.db.execute("DELETE FROM events WHERE ts < ?", (now - self.retention['events'],))
+            self.db.execute("DELETE FROM samples_1m WHERE bucket < ?", (now - self.retention['1m'],))
+            self.db.execute("DELETE FROM samples_1h WHERE bucket < ?", (now - self.retention['1h'],))
+        self.db.executescript("PRAGMA incremental_vacuum;")  # stepped to the end; execute() frees one page
+        self.last_rollup = time.monotonic()
+
+    def query(self, metric, start, end, resolution=None):
+        # Returns [(ts, value)]; rollup buckets report their mean. Without an
+        # explicit resolution the coarsest table that still has detail is used.
+        if resolution is None:
+            span = end - start
+            resolution = 'raw' if span <= 6 * 3600 else '1m' if span <= 7 * 86400 else '1h'
+        with self.reader_lock:
+            if self.reader is None:
+                self.reader = connect(self.path)
+            row = self.reader.execute("SELECT id FROM metrics WHERE name = ?", (metric,)).fetchone()
+            if row is None:
+                return []
+            if resolution == 'raw':
+                sql = "SELECT ts, value FROM samples WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts"
+            else:
+                sql = (f"SELECT bucket, total / count FROM samples_{resolution} "
+                       f"WHERE metric = ? AND bucket >= ? AND bucket < ? ORDER BY bucket")
+            return self.reader.execute(sql, (row[0], start, end)).fetchall()
+
+    def events_between(self, start, end):
+        with self.reader_lock:
+            if self.reader is None:
+                self.reader = connect(self.path)
+            return self.reader.execute(
+                "SELECT ts, kind, severity, text FROM events WHERE ts >= ? AND ts < ? ORDER BY ts",
+                (start, end)).fetchall()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.db.close()
+        if self.reader is not None:
+            self.reader.close()
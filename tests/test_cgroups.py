@@ -0,0 +1,94 @@
+import pytest
+
+import cl_cgroups
+from cl_cgroups import Cgroup, CgroupSource, cgroup2_root
+
+HYBRID = """\
+32 24 0:28 / /sys/fs/cgroup rw,relatime - tmpfs tmpfs rw,mode=755
+33 32 0:29 / /sys/fs/cgroup/cpu rw,relatime - cgroup cgroup rw,cpu
+42 32 0:38 / /sys/fs/cgroup/unified rw,relatime shared:9 - cgroup2 cgroup2 rw
+"""
+
+
+def test_hybrid_mount(tmp_path):
+    mountinfo = tmp_path / 'mountinfo'
+    mountinfo.write_text(HYBRID)
+    assert cgroup2_root(str(mountinfo)) == '/sys/fs/cgroup/unified'
+
+
+def test_escaped_mount_point(tmp_path):
+    mountinfo = tmp_path / 'mountinfo'
+    mountinfo.write_text("50 1 0:40 / /run/my\\040cgroups rw - cgroup2 none rw\n")
+    assert cgroup2_root(str(mountinfo)) == '/run/my cgroups'
+
+
+def test_no_cgroup2(tmp_path):
+    mountinfo = tmp_path / 'mountinfo'
+    mountinfo.write_text(HYBRID.replace('cgroup2', 'cgroup'))
+    with pytest.raises(OSError):
+        cgroup2_root(str(mountinfo))
+
+
+def make_cgroup(root, path, procs=()):
+    directory = root / path
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / 'cpu.stat').write_text("usage_usec 1000\nuser_usec 600\nsystem_usec 400\n")
+    (directory / 'cgroup.procs').write_text(''.join(f"{pid}\n" for pid in procs))
+
+
+def test_interior_cgroup_has_its_descendants_members(tmp_path):
+    make_cgroup(tmp_path, 'system.slice')
+    make_cgroup(tmp_path, 'system.slice/a.service', [101, 102])
+    make_cgroup(tmp_path, 'system.slice/b.service', [201])
+    cgroup = Cgroup(str(tmp_path), '/system.slice')
+    try:
+        assert sorted(cgroup.pids()) == [101, 102, 201]
+        assert cgroup.pid() in (101, 102, 201)
+    finally:
+        cgroup.close()
+
+
+def test_empty_cgroup_has_no_member(tmp_path):
+    make_cgroup(tmp_path, 'idle.slice')
+    cgroup = Cgroup(str(tmp_path), '/idle.slice')
+    try:
+        assert cgroup.pids() == []
+        assert cgroup.pid() is None
+    finally:
+        cgroup.close()
+
+
+class FakeNetDev:
+    def __init__(self, pid):
+        self.pid = pid
+
+    def read(self):
+        return {'eth0': self.pid}
+
+    def close(self):
+        pass
+
+
+def cgroup_source(tmp_path, monkeypatch, namespaces):
+    monkeypatch.setattr(cl_cgroups, 'netns_id', lambda pid: namespaces[pid])
+    monkeypatch.setattr(cl_cgroups, 'namespace_net_dev', FakeNetDev)
+    return CgroupSource('/app.slice', root=str(tmp_path))
+
+
+def test_host_namespace_members_are_skipped(tmp_path, monkeypatch):
+    make_cgroup(tmp_path, 'app.slice', [10])
+    make_cgroup(tmp_path, 'app.slice/container', [20])
+    source = cgroup_source(tmp_path, monkeypatch, {'self': 1, 10: 1, 20: 2})
+    try:
+        assert source.net_io_counters() == {'eth0': 20}
+    finally:
+        source.close()
+
+
+def test_host_namespace_only_has_no_network_figures(tmp_path, monkeypatch):
+    make_cgroup(tmp_path, 'app.slice', [10, 11])
+    source = cgroup_source(tmp_path, monkeypatch, {'self': 1, 10: 1, 11: 1})
+    try:
+        assert source.net_io_counters() == {}
+    finally:
+        source.close()
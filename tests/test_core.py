@@ -0,0 +1,207 @@
+import random
+
+import pytest
+
+from cl_core import (
+    CpuReader, CpuRules, NetAccounting, NetRates, QuotaForecast, QuotaStages, SpeechAlerts, WindowRate, time_to_limit
+)
+from cl_sources import ModelSource, ProcNetIO
+
+
+def feed(window, rate, interval, seconds, jitter=0.0, start=1000.0):
+    # Samples a steady rate the way the monitors do: a baseline read, then
+    # the bytes moved since the previous read every interval or so
+    random.seed(1)
+    window.begin(start)
+    now = start
+    while now < start + seconds:
+        step = interval * (1 + random.uniform(-jitter, jitter))
+        now += step
+        window.add(now, rate * step)
+    return now
+
+
+@pytest.mark.parametrize('span, slots', [(1.0, 10), (60.0, 60), (900.0, 90)])
+def test_first_sample_rate(span, slots):
+    window = WindowRate(span, slots)
+    window.begin(100.0)
+    window.add(101.0, 5000)
+    assert window.rate(101.0) == pytest.approx(5000, rel=0.01)
+
+
+@pytest.mark.parametrize('interval', [0.5, 1.0, 2.0, 5.0])
+@pytest.mark.parametrize('span, slots', [(1.0, 10), (60.0, 60), (900.0, 90)])
+def test_steady_rate_with_jitter(span, slots, interval):
+    window = WindowRate(span, slots)
+    now = feed(window, 2000.0, interval, 1200.0, jitter=0.05)
+    assert window.rate(now) == pytest.approx(2000.0, rel=0.01)
+
+
+def test_rate_falls_when_traffic_stops():
+    window = WindowRate(60.0, 60)
+    now = feed(window, 1000.0, 1.0, 120.0)
+    for _ in range(30):
+        now += 1.0
+        window.add(now, 0)
+    assert window.rate(now) == pytest.approx(500.0, rel=0.05)
+    for _ in range(31):
+        now += 1.0
+        window.add(now, 0)
+    assert window.rate(now) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_rate_after_a_long_gap():
+    window = WindowRate(1.0, 10)
+    window.begin(0.0)
+    window.add(1.0, 100)
+    window.add(3601.0, 3600)
+    assert window.rate(3601.0) == pytest.approx(1.0)
+
+
+def test_no_samples():
+    assert WindowRate(60.0).rate(5.0) == 0.0
+
+
+def test_net_rates_by_window():
+    rates = NetRates()
+    rates.begin(0.0)
+    for now in range(1, 11):
+        rates.add(float(now), 100, 400)
+    assert rates.rates(10.0)['1s'] == pytest.approx((100, 400))
+    assert rates.rates(10.0)['1m'] == pytest.approx((100, 400))
+
+
+def test_quota_stages_fire_once():
+    stages = QuotaStages((50, 80, 95))
+    assert stages.evaluate(10) == 0
+    assert stages.evaluate(55) == 1
+    assert stages.evaluate(60) == 0
+    assert stages.evaluate(99) == 3
+    assert stages.evaluate(99) == 0
+    stages.reset()
+    assert stages.evaluate(85) == 2
+
+
+def test_time_to_limit():
+    assert time_to_limit(10, None, 100) is None
+    assert time_to_limit(10, 20, 0) is None
+    assert time_to_limit(20, 20, 100) == 0.0
+    assert time_to_limit(25, 20, 0) == 0.0
+    assert time_to_limit(10, 20, 1048576) == pytest.approx(10.0)
+
+
+def test_quota_forecast_alerts():
+    forecast = QuotaForecast()
+    rates = {'1m': (0.0, 1048576.0)}
+    assert forecast.update(10, 100, rates) == []
+    assert forecast.eta == pytest.approx(90.0)
+    assert forecast.text() == "10% used, limit in about 2 min at the current rate"
+    [(stage, level, text)] = forecast.update(85, 100, rates)
+    assert (stage, level) == (2, 2)
+    assert text.startswith("80% of the 100 MB internet limit used")
+    alerts = forecast.update(101, 100, rates)
+    assert [(stage, level) for stage, level, text in alerts] == [(3, 3), (0, 3)]
+    assert forecast.update(102, 100, rates) == []
+    assert forecast.text() == "Limit reached"
+    forecast.reset()
+    assert [stage for stage, level, text in forecast.update(102, 100, rates)] == [3, 0]
+
+
+def test_speech_repeat_limit_is_per_kind(monkeypatch):
+    alerts = SpeechAlerts()
+    monkeypatch.setattr(alerts, 'run', lambda stop_event: None)  # no TTS engine
+    assert alerts.post('cpu', 'first', "CPU usage is high!")
+    assert alerts.post('mem', 'first', "Memory usage is high!")
+    assert not alerts.post('cpu', 'first', "CPU usage is high again!")
+    assert alerts.post('cpu', 'end', "CPU usage is very high!")
+    assert alerts.dropped == 1
+
+
+def test_net_counters_survive_boot_time_jitter(tmp_path):
+    path = str(tmp_path / 'net.json')
+    net = NetAccounting(path=path)
+    net.load(1000.0)
+    net.update({'eth0': ProcNetIO(0, 1000)})
+    net.update({'eth0': ProcNetIO(0, 3000)})
+    net.save()
+    again = NetAccounting(path=path)
+    again.load(1000.7)  # same boot, recomputed from a slightly different clock
+    assert again.update({'eth0': ProcNetIO(0, 4000)}) == 1000
+    rebooted = NetAccounting(path=path)
+    rebooted.load(90000.0)
+    assert rebooted.update({'eth0': ProcNetIO(0, 500)}) == 500
+
+
+def test_total_after_per_core_mode_uses_a_fresh_baseline():
+    pytest.importorskip('numpy')
+    source = ModelSource()
+    reader = CpuReader(source)
+    reader.read()
+    source.advance(10.0, 10.0)
+    assert reader.read() == (pytest.approx(10.0), None)
+    for _ in range(3):
+        source.advance(10.0, 90.0)
+        reader.read(percpu=True)
+    assert reader.read() == (None, None)
+    source.advance(1.0, 50.0)
+    assert reader.read() == (pytest.approx(50.0), None)
+
+
+def cpu_rules():
+    rules = CpuRules()
+    for level, value in enumerate((50, 70, 90), 1):
+        rules.set_threshold(level, value)
+    return rules
+
+
+def test_sustained_end_load_counts_every_sample():
+    rules = cpu_rules()
+    levels = [rules.evaluate(100.0) for _ in range(3600)]
+    assert levels[:2] == [3, 0]  # the first sample fills the mean on its own
+    assert rules.end_streak == 3600
+    assert rules.shutdown_due()
+
+
+def test_climb_through_lower_levels_keeps_counting():
+    rules = cpu_rules()
+    for _ in range(3):
+        rules.evaluate(0.0)
+    raised = [rules.evaluate(100.0) for _ in range(3)]
+    assert raised == [0, 1, 3]  # smoothed 33, 67, 100
+    for _ in range(4):
+        rules.evaluate(100.0)
+    assert rules.end_streak == 5
+    assert rules.shutdown_due()
+
+
+def test_repeated_bursts_do_not_add_up():
+    rules = cpu_rules()
+    for _ in range(10):
+        for _ in range(3):
+            rules.evaluate(100.0)
+        for _ in range(3):
+            rules.evaluate(0.0)
+    assert rules.end_streak == 0
+    for _ in range(3):
+        rules.evaluate(100.0)
+    assert rules.end_streak == 1
+    assert not rules.shutdown_due()
+
+
+def test_streak_survives_dips_within_hysteresis():
+    rules = cpu_rules()
+    for value in (95, 95, 95, 86, 95, 95):
+        rules.evaluate(value)
+    assert rules.end_streak == 6
+    rules.evaluate(0.0)
+    rules.evaluate(0.0)
+    assert rules.end_streak == 0
+
+
+def test_net_state_in_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    net = NetAccounting(path='totals.json')
+    net.load(0.0)
+    net.set_limit(5)
+    net.save()
+    assert (tmp_path / 'totals.json').exists()
@@ -0,0 +1,27 @@
+from cl_fleet import FleetCollector
+
+
+def test_summary_survives_bad_samples():
+    collector = FleetCollector()
+    collector.ingest('good', {'samples': [{'cpu': 40.0, 'rates': {'1m': [10, 20]}, 'alerts': [{}]}], 'dropped': 2})
+    collector.ingest('bad', {'samples': [{'cpu': 'x'}, {'rates': {'1m': [1]}}, {'rates': 'fast'}, 7, None]})
+    collector.ingest('bad', ['not', 'a', 'message'])
+    collector.ingest('bad', 'hello')
+    collector.ingest('bad', {'samples': 'many', 'dropped': 'some'})
+    report = collector.summary()
+    assert report['rejected'] == 8
+    assert report['samples'] == 1
+    assert report['hosts'] == 1
+    assert report['cpu']['max'] == 40.0
+    assert report['top_net'] == [['good', 30]]
+    assert report['alerts'] == 1
+    assert report['dropped'] == 2
+
+
+def test_partial_samples_are_kept():
+    collector = FleetCollector()
+    collector.ingest('quiet', {'samples': [{'ts': 1.0}, {'cpu': 5, 'rates': {'15m': [1, 2]}}]})
+    report = collector.summary()
+    assert report['samples'] == 2 and report['rejected'] == 0
+    assert report['top_cpu'] == [['quiet', 5]]
+    assert 'top_net' not in report
@@ -0,0 +1,16 @@
+import pytest
+
+import cl_headless
+
+
+def test_percpu_without_numpy_is_a_usage_error(monkeypatch, capsys):
+    monkeypatch.setattr(cl_headless, 'have_numpy', lambda: False)
+    with pytest.raises(SystemExit) as exit_info:
+        cl_headless.parse_args(['--percpu'])
+    assert exit_info.value.code == 2
+    assert '--percpu needs numpy' in capsys.readouterr().err
+
+
+def test_percpu_with_numpy(monkeypatch):
+    monkeypatch.setattr(cl_headless, 'have_numpy', lambda: True)
+    assert cl_headless.parse_args(['--percpu']).percpu
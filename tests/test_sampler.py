@@ -0,0 +1,84 @@
+from multiprocessing import shared_memory
+
+import pytest
+
+from cl_core import AdaptiveInterval
+from cl_sampler import HEADER, PERCPU, POLL_MAX, POLL_MIN, SEQ, SLOT_SIZE, SLOTS, TOP, SampleRing, SharedSampler
+
+
+@pytest.fixture
+def ring():
+    ring = SampleRing.create()
+    yield ring
+    ring.close()
+
+
+def test_samples_round_trip(ring):
+    leaders = [(93.5, 4242, 'python3'), (12.0, 7, 'a-very-long-process-name')]
+    ring.write(100.0, 87.5, [90.0, 85.0], 1.0, 3, leaders)
+    ring.write(101.0, 20.0, None, 0.5, 4, [])
+    assert ring.written() == 2
+    assert ring.read(0) == (100.0, 87.5, (90.0, 85.0), 1.0, 3,
+                            [(93.5, 4242, 'python3'), (12.0, 7, 'a-very-long-proc')])
+    assert ring.read(1) == (101.0, 20.0, None, 0.5, 4, [])
+
+
+def test_overwritten_samples_read_as_none(ring):
+    for n in range(SLOTS + 1):
+        ring.write(float(n), 10.0, None, 1.0, 0, [])
+    assert ring.read(0) is None
+    assert ring.read(1)[0] == 1.0
+    assert ring.read(SLOTS)[0] == float(SLOTS)
+
+
+def test_a_slot_being_written_reads_as_none(ring):
+    ring.write(100.0, 50.0, None, 1.0, 0, [])
+    SEQ.pack_into(ring.buf, HEADER.size, 2 * SLOTS + 1)  # the writer has started on sample SLOTS there
+    assert ring.read(0) is None
+    ring.write(200.0, 60.0, None, 1.0, 0, [])
+    SEQ.pack_into(ring.buf, HEADER.size + SLOT_SIZE, 3)  # sample 1 only half written
+    assert ring.read(1) is None
+
+
+def test_control_block(ring):
+    assert ring.control() == (0, 1.0, (None, None, None))
+    ring.set_control(PERCPU | TOP, 0.5, (50.0, None, 90.0))
+    assert ring.control() == (PERCPU | TOP, 0.5, (50.0, None, 90.0))
+
+
+def test_open_maps_the_same_ring(ring):
+    other = SampleRing.open(ring.name)
+    try:
+        ring.write(100.0, 42.0, [42.0], 1.0, 0, [])
+        assert other.written() == 1
+        assert other.read(0)[1] == 42.0
+        other.set_control(PERCPU, 2.0, (None, None, None))
+        assert ring.control()[:2] == (PERCPU, 2.0)
+    finally:
+        other.close()
+    assert ring.read(0)[1] == 42.0  # a reader closing does not unlink the ring
+
+
+def test_open_rejects_other_memory():
+    memory = shared_memory.SharedMemory(create=True, size=HEADER.size)
+    try:
+        with pytest.raises(ValueError):
+            SampleRing.open(memory.name)
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def test_poll_interval_follows_the_sampling_interval():
+    sampler = SharedSampler(interval=1.0)
+    try:
+        assert sampler.poll_interval() == 0.25
+        sampler.set_interval(0.1)
+        assert sampler.poll_interval() == POLL_MIN
+        sampler.set_interval(30.0)
+        assert sampler.poll_interval() == POLL_MAX
+        sampler.adaptive = AdaptiveInterval(1.0, 0.25, 5.0)
+        sampler.adaptive.current = 2.0
+        assert sampler.poll_interval() == 0.5
+    finally:
+        sampler.close()
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+from cl_sources import ProcfsSource, ProcNetDev, parse_btime
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'preadv'), reason="the /proc readers need os.preadv")
+
+NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:   12345      67    0    0    0     0          0         0    12345      67    0    0    0     0       0          0
+  eth0: 987654321  123456    0    3    0     0          0        12 55555555   65432    0    0    0     0       0          0
+"""
+
+
+def stat_text(cores, user=100):
+    lines = [f"cpu  {user * cores} 20 300 4000 50 0 6 0 0 0"]
+    lines += [f"cpu{n} {user} 5 75 1000 12 0 1 0 0 0" for n in range(cores)]
+    lines += ["intr 1234 0 0", "ctxt 5678", "btime 1700000000", "processes 999", ""]
+    return "\n".join(lines)
+
+
+@pytest.fixture
+def proc(tmp_path):
+    stat = tmp_path / 'stat'
+    net_dev = tmp_path / 'net_dev'
+    stat.write_text(stat_text(2))
+    net_dev.write_text(NET_DEV)
+    source = ProcfsSource(str(stat), str(net_dev))
+    yield source, stat, net_dev
+    source.close()
+
+
+def test_net_dev_counters(tmp_path):
+    path = tmp_path / 'net_dev'
+    path.write_text(NET_DEV)
+    net = ProcNetDev(str(path))
+    try:
+        counters = net.read()
+    finally:
+        net.close()
+    assert counters['lo'] == (12345, 12345)
+    assert counters['eth0'].bytes_recv == 987654321
+    assert counters['eth0'].bytes_sent == 55555555
+
+
+def test_net_dev_is_read_again_from_the_start(tmp_path):
+    path = tmp_path / 'net_dev'
+    path.write_text(NET_DEV)
+    net = ProcNetDev(str(path))
+    try:
+        net.read()
+        with open(path, 'r+') as f:  # same file, as /proc would be
+            f.write(NET_DEV.replace('987654321', '987654999'))
+        assert net.read()['eth0'].bytes_recv == 987654999
+    finally:
+        net.close()
+
+
+def test_net_dev_with_more_interfaces_than_the_buffer_holds(tmp_path):
+    header, rest = NET_DEV.split('    lo:', 1)
+    lines = [f"  veth{n:04}: {n} 1 0 0 0 0 0 0 {2 * n} 1 0 0 0 0 0 0\n" for n in range(400)]
+    path = tmp_path / 'net_dev'
+    path.write_text(header + ''.join(lines))
+    assert path.stat().st_size > 16384
+    net = ProcNetDev(str(path))
+    try:
+        counters = net.read()
+    finally:
+        net.close()
+    assert len(counters) == 400
+    assert counters['veth0399'] == (798, 399)
+
+
+def test_boot_time():
+    assert parse_btime(stat_text(1).encode()) == 1700000000.0
+    with pytest.raises(IndexError):
+        parse_btime(b"cpu  1 2 3 4\n")
+
+
+def test_cpu_times_in_seconds(proc):
+    source, stat, net_dev = proc
+    ticks = os.sysconf('SC_CLK_TCK')
+    times = source.cpu_times()
+    assert len(times._fields) == 10
+    assert times.user == 200 / ticks
+    assert times.idle == 4000 / ticks
+    cores = source.cpu_times(percpu=True)
+    assert len(cores) == 2
+    assert cores[1].system == 75 / ticks
+    assert source.boot_time() == 1700000000.0
+    assert source.net_io_counters()['eth0'].bytes_sent == 55555555
+
+
+def test_older_kernels_have_fewer_cpu_fields(tmp_path):
+    stat = tmp_path / 'stat'
+    stat.write_text("cpu  1 2 3 4 5 6 7\ncpu0 1 2 3 4 5 6 7\nintr 0\nbtime 1\n")
+    net_dev = tmp_path / 'net_dev'
+    net_dev.write_text(NET_DEV)
+    source = ProcfsSource(str(stat), str(net_dev))
+    try:
+        assert source.cpu_times()._fields == ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq')
+    finally:
+        source.close()
+
+
+def test_cores_coming_online_grow_the_buffer(proc):
+    source, stat, net_dev = proc
+    with open(stat, 'r+') as f:
+        f.write(stat_text(256, user=200))
+    cores = source.cpu_times(percpu=True)
+    assert len(cores) == 256
+    assert cores[-1].user == 200 / os.sysconf('SC_CLK_TCK')
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from cl_store import MetricStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetricStore(str(tmp_path / 'history.db'), flush_every=3600)
+    yield store
+    store.close()
+
+
+def free_pages(store):
+    return store.db.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def test_retention_gives_the_space_back(store):
+    now = time.time()
+    for second in range(100000):
+        store.record('cpu', 50.0, now - 5 * 86400 + second)
+    store.flush()
+    pages = store.db.execute("PRAGMA page_count").fetchone()[0]
+    store.rollup(now)
+    assert store.query('cpu', 0, now, 'raw') == []
+    assert free_pages(store) == 0
+    assert store.db.execute("PRAGMA page_count").fetchone()[0] < pages / 10
+
+
+def test_events_outlive_raw_samples(store):
+    now = time.time()
+    store.record('cpu', 99.0, now - 3 * 86400)
+    store.record_event('cpu', 'end', "CPU usage is very high!", now - 3 * 86400)
+    store.record_event('cpu', 'first', "CPU usage is high!", now - 400 * 86400)
+    store.flush()
+    store.rollup(now)
+    assert store.query('cpu', 0, now, 'raw') == []
+    assert [text for ts, kind, severity, text in store.events_between(0, now)] == ["CPU usage is very high!"]
+
+
+HOUR = 1_700_000_000 // 3600 * 3600  # an hour boundary, so buckets line up
+
+
+def test_rollup_keeps_mean_low_and_high_per_bucket(store):
+    for second in range(60):
+        store.record('cpu', 10.0 if second % 2 else 30.0, HOUR + second)
+        store.record('cpu', 50.0, HOUR + 60 + second)
+    store.flush()
+    store.rollup(HOUR + 7200)
+    assert store.query('cpu', HOUR, HOUR + 120, '1m') == [(HOUR, 20.0), (HOUR + 60, 50.0)]
+    assert store.db.execute("SELECT count, low, high FROM samples_1m WHERE bucket = ?", (HOUR,)).fetchone() == (
+        60, 10.0, 30.0)
+    assert store.query('cpu', HOUR, HOUR + 3600, '1h') == [(HOUR, 35.0)]
+
+
+def test_rollup_counts_each_sample_once(store):
+    for second in range(120):
+        store.record('cpu', 40.0, HOUR + second)
+    store.flush()
+    store.rollup(HOUR + 90)  # only the first minute is complete
+    store.rollup(HOUR + 90)
+    assert store.db.execute("SELECT bucket, count FROM samples_1m").fetchall() == [(HOUR, 60)]
+    store.rollup(HOUR + 7200)
+    assert store.db.execute("SELECT bucket, count FROM samples_1m ORDER BY bucket").fetchall() == [
+        (HOUR, 60), (HOUR + 60, 60)]
+    assert store.db.execute("SELECT bucket, count FROM samples_1h").fetchall() == [(HOUR, 120)]
+
+
+def test_each_table_has_its_own_retention(tmp_path):
+    store = MetricStore(str(tmp_path / 'history.db'), flush_every=3600,
+                        retention={'raw': 60, '1m': 7200, '1h': 10 * 86400})
+    try:
+        for second in range(60):
+            store.record('cpu', 25.0, HOUR + second)
+        store.flush()
+        store.rollup(HOUR + 3 * 3600)
+        assert store.query('cpu', 0, HOUR + 86400, 'raw') == []
+        assert store.query('cpu', 0, HOUR + 86400, '1m') == []
+        assert store.query('cpu', 0, HOUR + 86400, '1h') == [(HOUR, 25.0)]
+        store.rollup(HOUR + 11 * 86400)
+        assert store.query('cpu', 0, HOUR + 86400, '1h') == []
+    finally:
+        store.close()
+
+
+def test_query_picks_the_resolution_from_the_span(store):
+    for second in range(120):
+        store.record('cpu', 60.0, HOUR + second)
+    store.flush()
+    store.rollup(HOUR + 7200)
+    assert len(store.query('cpu', HOUR, HOUR + 3600)) == 120
+    assert store.query('cpu', HOUR, HOUR + 2 * 86400) == [(HOUR, 60.0), (HOUR + 60, 60.0)]
+    assert store.query('cpu', HOUR, HOUR + 30 * 86400) == [(HOUR, 60.0)]
+    assert store.query('missing', HOUR, HOUR + 3600) == []
@@ -0,0 +1,63 @@
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip('PyQt5')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from cl_actions import ActionExecutor  # noqa: E402
+from cl_sources import SyntheticSource  # noqa: E402
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def app():
+    from PyQt5.QtWidgets import QApplication
+    spec = importlib.util.spec_from_file_location('cl_center_app', os.path.join(HERE, 'CL Center.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    qt = QApplication.instance() or QApplication([])
+    yield module
+    qt.processEvents()
+
+
+@pytest.fixture
+def cpu_page(app):
+    center = app.ControlCenter(source=SyntheticSource(seed=1), actions=ActionExecutor(dry_run=True))
+    center.open_cpu_usage()
+    page = center.currentWidget()
+    page.cpu_button_clicked()
+    yield page
+    center.close()
+
+
+def test_disarming_cancels_a_pending_shutdown(cpu_page):
+    cpu_page.shu()
+    cpu_page.arm_action(100.0)
+    assert cpu_page.countdown.isActive()
+    cpu_page.shu()
+    assert not cpu_page.countdown.isActive()
+    assert cpu_page.pending_action is None
+
+
+def test_stopping_monitoring_cancels_a_pending_action(cpu_page):
+    cpu_page.shu()
+    cpu_page.c_o1()
+    cpu_page.arm_action(100.0)
+    assert cpu_page.countdown.isActive()
+    cpu_page.c_o1()
+    assert not cpu_page.countdown.isActive()
+    assert cpu_page.pending_action is None
+
+
+def test_pages_sample_at_the_chosen_interval(app):
+    center = app.ControlCenter(source=SyntheticSource(seed=1), sample_interval=0.5)
+    try:
+        center.open_cpu_usage()
+        assert center.currentWidget().sampler.interval == 0.5
+        center.open_internet_usage()
+        assert center.currentWidget().timer.interval() == 500
+    finally:
+        center.close()